@@ -0,0 +1,236 @@
+import hashlib
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from sqlalchemy.orm import joinedload
+
+import geo
+import search
+from models import db, Area, Artist, Show, Venue
+from pagination import InvalidCursor, paginate_keyset
+
+#----------------------------------------------------------------------------#
+# JSON API, version 1.
+#----------------------------------------------------------------------------#
+
+# Read-only JSON views of the same models the HTML pages use. Every response
+# carries a strong ETag derived from the `version` column of the rows it
+# contains (plus the request's query string), so a client that repeats a
+# request with If-None-Match gets an empty 304 without the rows being
+# serialized or sent again.
+#
+# ?fields=id,name limits each object to the listed fields.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_FIELDS = {
+  'id': lambda venue: venue.id,
+  'name': lambda venue: venue.name,
+  'area_id': lambda venue: venue.area_id,
+  'city': lambda venue: venue.area.city,
+  'state': lambda venue: venue.area.state,
+  'address': lambda venue: venue.address,
+  'latitude': lambda venue: venue.latitude,
+  'longitude': lambda venue: venue.longitude,
+  'phone': lambda venue: venue.phone,
+  'genres': lambda venue: [genre.name for genre in venue.genres],
+  'image_link': lambda venue: venue.image_link,
+  'facebook_link': lambda venue: venue.facebook_link,
+  'website_link': lambda venue: venue.website_link,
+  'seeking_talent': lambda venue: venue.seeking_talent,
+  'seeking_description': lambda venue: venue.seeking_description,
+}
+
+ARTIST_FIELDS = {
+  'id': lambda artist: artist.id,
+  'name': lambda artist: artist.name,
+  'city': lambda artist: artist.city,
+  'state': lambda artist: artist.state,
+  'phone': lambda artist: artist.phone,
+  'genres': lambda artist: [genre.name for genre in artist.genres],
+  'image_link': lambda artist: artist.image_link,
+  'facebook_link': lambda artist: artist.facebook_link,
+  'website_link': lambda artist: artist.website_link,
+  'seeking_venue': lambda artist: artist.seeking_venue,
+  'seeking_description': lambda artist: artist.seeking_description,
+}
+
+# Shows are served from a projection joining in artist and venue names (see _show_rows)
+SHOW_FIELDS = {
+  'id': lambda show: show.id,
+  'artist_id': lambda show: show.artist_id,
+  'artist_name': lambda show: show.artist_name,
+  'artist_image_link': lambda show: show.artist_image_link,
+  'venue_id': lambda show: show.venue_id,
+  'venue_name': lambda show: show.venue_name,
+  'venue_image_link': lambda show: show.venue_image_link,
+  'start_time': lambda show: show.start_time.isoformat() if show.start_time else None,
+  'end_time': lambda show: show.end_time.isoformat() if show.end_time else None,
+}
+
+AREA_FIELDS = {
+  'id': lambda area: area.id,
+  'city': lambda area: area.city,
+  'state': lambda area: area.state,
+}
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def _fieldset(fields):
+  requested = request.args.get('fields')
+  if not requested:
+    return list(fields)
+  names = [name.strip() for name in requested.split(',') if name.strip()]
+  unknown = [name for name in names if name not in fields]
+  if unknown:
+    abort(400, description='Unknown fields: %s' % ', '.join(unknown))
+  return names
+
+
+def _row_version(row):
+  return row.version
+
+
+def _show_version(show):
+  # A show's payload also changes when its artist or venue is edited
+  return '%d.%d.%d' % (show.version, show.artist_version, show.venue_version)
+
+
+def _etag(rows, extra, version):
+  # Strong validator: changes whenever any row's version, the set of rows, the
+  # query string or `extra` (page metadata such as cursors and totals) changes
+  digest = hashlib.sha1(('%s|%s|' % (request.full_path, extra)).encode())
+  for row in rows:
+    digest.update(('%d:%s;' % (row.id, version(row))).encode())
+  return digest.hexdigest()
+
+
+def _respond(rows, fields, build, extra='', version=_row_version):
+  # 304 when the client's copy is current; otherwise serialize only the requested fields
+  names = _fieldset(fields)
+  etag = _etag(rows, extra, version)
+  if request.if_none_match.contains(etag):
+    response = current_app.response_class(status=304)
+  else:
+    response = jsonify(build(lambda row: {name: fields[name](row) for name in names}))
+  response.set_etag(etag)
+  response.headers['Cache-Control'] = 'public, max-age=%d, must-revalidate' % current_app.config['API_MAX_AGE']
+  return response
+
+
+def _show_rows():
+  return db.session.query(
+    Show.id, Show.version, Show.start_time, Show.end_time, Show.artist_id, Show.venue_id,
+    Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'), Artist.version.label('artist_version'),
+    Venue.name.label('venue_name'), Venue.image_link.label('venue_image_link'), Venue.version.label('venue_version'),
+  ).join(Artist, Artist.id == Show.artist_id).join(Venue, Venue.id == Show.venue_id) \
+    .filter(Artist.archived_at.is_(None), Venue.archived_at.is_(None)) # Like /shows, which hides archived artists' and venues' shows
+
+
+def _list(query, model, fields, version=_row_version):
+  per_page = request.args.get('per_page', current_app.config['LISTING_PAGE_SIZE'], type=int)
+  per_page = max(1, min(per_page, current_app.config['LISTING_MAX_PAGE_SIZE']))
+  try:
+    page = paginate_keyset(query, [model.id], key=lambda row: (row.id,), cursor=request.args.get('cursor'), per_page=per_page)
+  except InvalidCursor:
+    abort(400, description='Invalid cursor')
+  return _respond(page.items, fields, lambda serialize: {
+    "data": [serialize(row) for row in page.items],
+    "next_cursor": page.next_cursor,
+    "prev_cursor": page.prev_cursor,
+  }, extra='%s,%s' % (page.next_cursor, page.prev_cursor), version=version)
+
+
+def _detail(query, model, row_id, fields, version=_row_version):
+  row = query.filter(model.id == row_id).first()
+  if row is None:
+    abort(404, description='Not found')
+  return _respond([row], fields, lambda serialize: {"data": serialize(row)}, version=version)
+
+
+def _search(model, fields):
+  results = search.search(model, request.args.get('q', ''), page=request.args.get('page', 1, type=int))
+  return _respond(results.items, fields, lambda serialize: {
+    "data": [serialize(row) for row in results.items],
+    "count": results.total,
+    "page": results.page,
+    "per_page": results.per_page,
+  }, extra=results.total)
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+  return jsonify({"error": error.description}), error.code
+
+#----------------------------------------------------------------------------#
+# Endpoints.
+#----------------------------------------------------------------------------#
+
+@api.route('/venues')
+def list_venues():
+  return _list(Venue.active().options(joinedload(Venue.area)), Venue, VENUE_FIELDS)
+
+@api.route('/venues/search')
+def search_venues():
+  return _search(Venue, VENUE_FIELDS)
+
+@api.route('/venues/near')
+def venues_near():
+  # ?lat=&lng= with ?radius_km= for every venue within that distance, or
+  # without it the ?limit= nearest; nearest first, each with its distance_km
+  latitude, longitude = geo.coordinates(request.args.get('lat', type=float), request.args.get('lng', type=float))
+  if latitude is None:
+    abort(400, description='lat and lng are required')
+  limit = request.args.get('limit', current_app.config['GEO_NEAREST_LIMIT'], type=int)
+  limit = max(1, min(limit, current_app.config['LISTING_MAX_PAGE_SIZE']))
+  radius_km = request.args.get('radius_km', type=float)
+  if radius_km is not None:
+    found = geo.within(latitude, longitude, max(0.0, min(radius_km, current_app.config['GEO_MAX_RADIUS_KM'])), limit)
+  else:
+    found = geo.nearest(latitude, longitude, limit, current_app.config['GEO_MAX_RADIUS_KM'])
+  distances = {venue_id: distance for distance, venue_id in found}
+  venues = geo.load_venues(found)
+  fields = dict(VENUE_FIELDS, distance_km=lambda venue: round(distances[venue.id], 3))
+  return _respond(venues, fields, lambda serialize: {
+    "data": [serialize(venue) for venue in venues],
+  })
+
+@api.route('/venues/<int:venue_id>')
+def get_venue(venue_id):
+  return _detail(Venue.active().options(joinedload(Venue.area)), Venue, venue_id, VENUE_FIELDS)
+
+@api.route('/artists')
+def list_artists():
+  return _list(Artist.active(), Artist, ARTIST_FIELDS)
+
+@api.route('/artists/search')
+def search_artists():
+  return _search(Artist, ARTIST_FIELDS)
+
+@api.route('/artists/<int:artist_id>')
+def get_artist(artist_id):
+  return _detail(Artist.active(), Artist, artist_id, ARTIST_FIELDS)
+
+@api.route('/shows')
+def list_shows():
+  # Optionally narrowed with ?venue_id= or ?artist_id=
+  query = _show_rows()
+  if request.args.get('venue_id', type=int) is not None:
+    query = query.filter(Show.venue_id == request.args.get('venue_id', type=int))
+  if request.args.get('artist_id', type=int) is not None:
+    query = query.filter(Show.artist_id == request.args.get('artist_id', type=int))
+  return _list(query, Show, SHOW_FIELDS, version=_show_version)
+
+@api.route('/shows/<int:show_id>')
+def get_show(show_id):
+  return _detail(_show_rows(), Show, show_id, SHOW_FIELDS, version=_show_version)
+
+@api.route('/areas')
+def list_areas():
+  return _list(Area.query, Area, AREA_FIELDS)
+
+@api.route('/areas/<int:area_id>')
+def get_area(area_id):
+  return _detail(Area.query, Area, area_id, AREA_FIELDS)
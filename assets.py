@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+import click
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+  import brotli
+except ImportError: # Optional: without it only gzip variants are written
+  brotli = None
+
+try:
+  import rjsmin
+except ImportError: # Optional: without it scripts are concatenated as they are
+  rjsmin = None
+
+#----------------------------------------------------------------------------#
+# Static asset pipeline.
+#----------------------------------------------------------------------------#
+
+# `flask build-assets` bundles the stylesheets and scripts of
+# layouts/main.html, minifies them, copies every file under static/ to
+# static/dist/ with a content hash in its name, writes gzip (and, with the
+# brotli package, brotli) variants next to them and records it all in
+# static/dist/manifest.json. Hashed files never change, so /assets/ serves
+# them with a one-year immutable Cache-Control and browsers never revalidate.
+#
+# Templates link assets through bundle_urls() and asset_url(). Until the
+# manifest exists (e.g. in development) they fall back to the plain files.
+
+BUNDLES = {
+  'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css', 'css/main.responsive.css', 'css/main.quickfix.css'],
+  'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+  'main.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+CSS_SPACE = re.compile(r'\s*([{};,>])\s*') # Not ':', which is significant in selectors
+
+assets = Blueprint('assets', __name__)
+
+#----------------------------------------------------------------------------#
+# Build.
+#----------------------------------------------------------------------------#
+
+def _hashed_name(name, content):
+  root, extension = posixpath.splitext(name)
+  return '%s.%s%s' % (root, hashlib.sha256(content).hexdigest()[:12], extension)
+
+
+def minify_css(css):
+  # Comments and insignificant whitespace only; values and selectors are left alone
+  css = CSS_COMMENT.sub('', css)
+  css = CSS_SPACE.sub(r'\1', css)
+  return re.sub(r'\s+', ' ', css).replace(';}', '}').strip()
+
+
+def _rewrite_css_urls(css, source, manifest):
+  # Bundles live elsewhere than their sources, so relative url()s are resolved
+  # and pointed at the hashed copy when there is one
+  def replace(match):
+    url = match.group(2)
+    if re.match(r'^(data:|https?:|//|/|#)', url):
+      return match.group(0)
+    path, separator, suffix = re.match(r'([^?#]*)([?#]?)(.*)', url).groups()
+    name = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+    target = '/assets/' + manifest[name] if name in manifest else '/static/' + name
+    return 'url("%s%s%s")' % (target, separator, suffix)
+  return CSS_URL.sub(replace, css)
+
+
+def _write(output, name, content):
+  path = os.path.join(output, name)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, 'wb') as stream:
+    stream.write(content)
+  if name.endswith(COMPRESSIBLE):
+    with open(path + '.gz', 'wb') as stream:
+      stream.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+      with open(path + '.br', 'wb') as stream:
+        stream.write(brotli.compress(content))
+
+
+def build_assets(static_folder, output):
+  # Returns the manifest: logical name (relative to static/) -> hashed name (relative to output)
+  if os.path.isdir(output):
+    shutil.rmtree(output)
+  manifest = {}
+
+  # Plain files first, so bundles can point their url()s at the hashed copies
+  for directory, _, files in os.walk(static_folder):
+    if os.path.abspath(directory).startswith(os.path.abspath(output)):
+      continue
+    for filename in sorted(files):
+      name = os.path.relpath(os.path.join(directory, filename), static_folder).replace(os.sep, '/')
+      with open(os.path.join(static_folder, name), 'rb') as stream:
+        content = stream.read()
+      manifest[name] = _hashed_name(name, content)
+      _write(output, manifest[name], content)
+
+  for bundle, sources in BUNDLES.items():
+    parts = []
+    for source in sources:
+      with open(os.path.join(static_folder, source), encoding='utf-8') as stream:
+        text = stream.read()
+      if bundle.endswith('.css'):
+        parts.append(minify_css(_rewrite_css_urls(text, source, manifest)))
+      else:
+        parts.append(rjsmin.jsmin(text) if rjsmin is not None and not source.endswith('.min.js') else text)
+    content = ('\n' if bundle.endswith('.css') else ';\n').join(parts).encode('utf-8')
+    manifest['bundles/' + bundle] = _hashed_name('bundles/' + bundle, content)
+    _write(output, manifest['bundles/' + bundle], content)
+
+  with open(os.path.join(output, 'manifest.json'), 'w') as stream:
+    json.dump(manifest, stream, indent=2, sort_keys=True)
+  return manifest
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+  """Bundle, minify, fingerprint and precompress the static files."""
+  app = current_app._get_current_object()
+  manifest = build_assets(app.static_folder, app.config['ASSETS_OUTPUT'])
+  for bundle in BUNDLES:
+    path = os.path.join(app.config['ASSETS_OUTPUT'], manifest['bundles/' + bundle])
+    click.echo('%-10s %8d bytes  %8d gzipped  %s' % (
+      bundle, os.path.getsize(path), os.path.getsize(path + '.gz'), manifest['bundles/' + bundle]))
+  click.echo('%d files written to %s' % (len(manifest), app.config['ASSETS_OUTPUT']))
+
+#----------------------------------------------------------------------------#
+# Serving.
+#----------------------------------------------------------------------------#
+
+def init_assets(app):
+  path = os.path.join(app.config['ASSETS_OUTPUT'], 'manifest.json')
+  manifest = {}
+  if os.path.exists(path):
+    with open(path) as stream:
+      manifest = json.load(stream)
+  app.extensions['assets_manifest'] = manifest
+  app.extensions['assets_files'] = set(manifest.values())
+  app.jinja_env.globals.update(asset_url=asset_url, bundle_urls=bundle_urls)
+
+
+def asset_url(name):
+  # url_for('static', filename=name), but to the fingerprinted copy once built
+  hashed = current_app.extensions['assets_manifest'].get(name)
+  return url_for('assets.serve_asset', filename=hashed) if hashed else url_for('static', filename=name)
+
+
+def bundle_urls(bundle):
+  # One URL for a built bundle, otherwise one per source file
+  hashed = current_app.extensions['assets_manifest'].get('bundles/' + bundle)
+  if hashed:
+    return [url_for('assets.serve_asset', filename=hashed)]
+  return [url_for('static', filename=source) for source in BUNDLES[bundle]]
+
+
+@assets.route('/assets/<path:filename>')
+def serve_asset(filename):
+  # Serves the precompressed variant the client accepts; nginx can do the same with gzip_static/brotli_static
+  output = current_app.config['ASSETS_OUTPUT']
+  if filename not in current_app.extensions['assets_files']:
+    abort(404)
+  variants = [('br', '.br'), ('gzip', '.gz')] if filename.endswith(COMPRESSIBLE) else []
+  for encoding, extension in variants:
+    if encoding in request.accept_encodings and os.path.exists(os.path.join(output, filename + extension)):
+      mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+      response = send_from_directory(output, filename + extension, mimetype=mimetype)
+      response.headers['Content-Encoding'] = encoding
+      break
+  else:
+    response = send_from_directory(output, filename)
+  response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % current_app.config['ASSETS_MAX_AGE']
+  response.headers['Vary'] = 'Accept-Encoding'
+  return response
@@ -0,0 +1,912 @@
+import json
+import math
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import babel.dates
+import click
+import dateutil.parser
+from flask import current_app, render_template
+from flask.cli import AppGroup
+from flask_migrate import upgrade
+from sqlalchemy import MetaData, func, insert
+
+import bookings
+import geo
+import jobs
+import search
+import stats
+from filters import format_datetime
+from forms import VenueForm
+from models import db, Area, Artist, Genre, Show, Venue
+from pagination import encode_cursor
+
+#----------------------------------------------------------------------------#
+# Route benchmarks.
+#----------------------------------------------------------------------------#
+
+# `flask bench seed` fills a throwaway SQLite or PostgreSQL database with a
+# reproducible data set, `flask bench run` requests every GET route (plus
+# searches, deep keyset pages and POSTed searches) through the test client,
+# and `flask bench http` drives a running server, e.g. gunicorn, with
+# concurrent requests. Both write a JSON report with throughput, p50/p95/p99
+# latency and queries per request (read from the Server-Timing header added
+# by instrumentation.py) that `flask bench compare` diffs between commits.
+
+bench = AppGroup('bench', help='Seed a benchmark database and measure every route.')
+
+SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+# Endpoints that change data when requested with GET
+UNSAFE_ENDPOINTS = {'main.delete_venue', 'main.delete_artist'}
+
+# Endpoints that need query arguments; scenarios() adds them with sample values
+QUERY_ENDPOINTS = {'api.venues_near'}
+
+# Pages whose queries run through read_pool.gather() (`flask bench detail`)
+DETAIL_ENDPOINTS = {'main.show_venue', 'main.show_artist'}
+
+WORDS = ['Blue', 'Velvet', 'Hop', 'Electric', 'Owl', 'Lantern', 'Park', 'Square', 'Petals',
+         'Canyon', 'Echo', 'Harbor', 'Moon', 'Cellar', 'Garden', 'Static', 'Copper', 'River']
+
+#----------------------------------------------------------------------------#
+# Seed data.
+#----------------------------------------------------------------------------#
+
+def _choices(field):
+  return [value for value, _ in field.kwargs['choices']]
+
+
+def reset_database():
+  # Drops every table, alembic_version included, and rebuilds the schema with
+  # the migrations, so the indexes and constraints that only they create (the
+  # GIN search indexes and show exclusion constraints on PostgreSQL) are there
+  tables = MetaData()
+  tables.reflect(bind=db.engine)
+  tables.drop_all(bind=db.engine)
+  upgrade(directory=os.path.join(current_app.root_path, 'migrations'))
+
+
+def seed_database(areas, venues, artists, shows, seed=0, chunk_size=1000):
+  # Venues and artists go through the ORM so search documents and stats rows
+  # are written the way the app writes them; shows are bulk inserted
+  rng = random.Random(seed)
+  states, genre_names = _choices(VenueForm.state), _choices(VenueForm.genres)
+  name = lambda: ' '.join(rng.sample(WORDS, 2))
+
+  area_rows = [Area(city='%s %d' % (rng.choice(WORDS), number), state=rng.choice(states)) for number in range(areas)]
+  db.session.add_all(area_rows)
+  genres = Genre.from_names(genre_names)
+  db.session.commit()
+
+  # Each area gets a centre somewhere in the contiguous US and its venues are
+  # scattered up to about 30 km around it, so venues cluster like real cities
+  centres = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in area_rows]
+  def venue(number):
+    area = rng.randrange(len(area_rows))
+    latitude, longitude = centres[area]
+    return Venue(name='The %s %d' % (name(), number), address='%d Main Street' % number, phone='555-%04d' % number,
+                 area=area_rows[area], genres=rng.sample(genres, rng.randint(1, 3)), seeking_talent=rng.random() < 0.5,
+                 latitude=latitude + rng.uniform(-0.25, 0.25), longitude=longitude + rng.uniform(-0.3, 0.3))
+
+  for start in range(0, venues, chunk_size):
+    db.session.add_all([venue(number) for number in range(start, min(start + chunk_size, venues))])
+    db.session.commit()
+
+  for start in range(0, artists, chunk_size):
+    db.session.add_all([
+      Artist(name='%s %d' % (name(), number), city=rng.choice(area_rows).city, state=rng.choice(states),
+             phone='555-%04d' % number, genres=rng.sample(genres, rng.randint(1, 3)), seeking_venue=rng.random() < 0.5)
+      for number in range(start, min(start + chunk_size, artists))
+    ])
+    db.session.commit()
+
+  # Shows spread over a year either side of now, so both past and upcoming lists
+  # fill up; a slot that would double-book its venue or artist is drawn again
+  venue_ids = [venue_id for (venue_id,) in db.session.query(Venue.id)]
+  artist_ids = [artist_id for (artist_id,) in db.session.query(Artist.id)]
+  now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+  schedules = defaultdict(lambda: bookings.Schedule(bookings.max_duration()))
+  def booking():
+    for _ in range(1000):
+      venue_id, artist_id = rng.choice(venue_ids), rng.choice(artist_ids)
+      start_time = now + timedelta(hours=rng.randint(-24 * 365, 24 * 365))
+      end_time = bookings.default_end_time(start_time)
+      owners = [schedules['venue', venue_id], schedules['artist', artist_id]]
+      if not any(owner.overlapping(start_time, end_time) for owner in owners):
+        for owner in owners:
+          owner.add(start_time, end_time, None)
+        return {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time, 'end_time': end_time}
+    raise click.ClickException('No free slot left for another show; seed fewer shows or more venues and artists.')
+
+  for start in range(0, shows if venue_ids and artist_ids else 0, chunk_size):
+    db.session.execute(insert(Show.__table__), [booking() for _ in range(start, min(start + chunk_size, shows))])
+    db.session.commit()
+
+  # Core inserts bypass the stats hooks; rebuild every counter once at the end
+  for model in stats.STATS:
+    stats.refresh_stats(db.session, model)
+  db.session.commit()
+
+#----------------------------------------------------------------------------#
+# Scenarios.
+#----------------------------------------------------------------------------#
+
+def _samples():
+  # One existing row of each kind, picked from the middle of the id range
+  def middle(column):
+    low, high = db.session.query(func.min(column), func.max(column)).one()
+    return db.session.query(column).filter(column >= (low + high) // 2).order_by(column).limit(1).scalar() \
+      if low is not None else None
+
+  venue_id, artist_id = middle(Venue.id), middle(Artist.id)
+  show = db.session.query(Show).filter(Show.id == middle(Show.id)).first()
+  genre = db.session.query(Genre.name).order_by(Genre.name).limit(1).scalar()
+  term = db.session.query(Venue.name).filter(Venue.id == venue_id).scalar()
+  location = db.session.query(Venue.latitude, Venue.longitude).filter(Venue.id >= venue_id, Venue.geo_cell.isnot(None)) \
+    .order_by(Venue.id).first() if venue_id is not None else None
+  return {
+    'venue_id': venue_id,
+    'artist_id': artist_id,
+    'show_id': show.id if show else None,
+    'area_id': middle(Area.id),
+    'genre': genre,
+    'term': search.tokenize(term)[0][:3] if term else 'hop',
+    'show': show,
+    'location': tuple(location) if location else None,
+  }
+
+
+def scenarios(app):
+  # (name, method, path, form data) for every GET route that can be built
+  # from the sample rows, plus searches and pages deep into each listing
+  samples = _samples()
+  adapter = app.url_map.bind('localhost')
+  found, skipped = [], []
+  for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+    if 'GET' not in rule.methods or rule.endpoint == 'static' or rule.endpoint in UNSAFE_ENDPOINTS | QUERY_ENDPOINTS:
+      continue
+    values = {argument: samples.get(argument) for argument in rule.arguments}
+    if any(value is None for value in values.values()):
+      skipped.append(rule.rule)
+      continue
+    found.append((rule.endpoint, 'GET', adapter.build(rule.endpoint, values), None))
+
+  term = samples['term']
+  found += [
+    ('search venues', 'GET', '/venues/search?search_term=%s' % term, None),
+    ('search venues (POST)', 'POST', '/venues/search', {'search_term': term}),
+    ('search artists', 'GET', '/artists/search?search_term=%s' % term, None),
+    ('api search venues', 'GET', '/api/v1/venues/search?q=%s' % term, None),
+  ]
+  # Keyset pages should cost the same in the middle of a listing as on page one
+  if samples['artist_id'] is not None:
+    found += [
+      ('artists (middle page)', 'GET', '/artists?cursor=%s' % encode_cursor('next', [samples['artist_id']]), None),
+      ('api artists (middle page)', 'GET', '/api/v1/artists?cursor=%s' % encode_cursor('next', [samples['artist_id']]), None),
+    ]
+  if samples['location'] is not None:
+    found += [
+      ('api venues near (nearest)', 'GET', '/api/v1/venues/near?lat=%s&lng=%s' % samples['location'], None),
+      ('api venues near (10 km)', 'GET', '/api/v1/venues/near?lat=%s&lng=%s&radius_km=10' % samples['location'], None),
+    ]
+  if samples['show'] is not None:
+    show = samples['show']
+    cursor = encode_cursor('next', [show.venue_id, show.start_time, show.id])
+    found.append(('shows (middle page)', 'GET', '/shows?cursor=%s' % cursor, None))
+  return found, skipped
+
+
+def query_scenarios():
+  # Query-level comparisons that have no route of their own: the substring
+  # scan the search pages used to run versus the current search
+  term = _samples()['term']
+  return [
+    ('query: venue name ILIKE scan', lambda: Venue.query.filter(Venue.name.ilike('%' + term + '%')).limit(10).all()),
+    ('query: venue search', lambda: search.search(Venue, term).items),
+    ('query: artist name ILIKE scan', lambda: Artist.query.filter(Artist.name.ilike('%' + term + '%')).limit(10).all()),
+    ('query: artist search', lambda: search.search(Artist, term).items),
+  ]
+
+#----------------------------------------------------------------------------#
+# Measurement.
+#----------------------------------------------------------------------------#
+
+def percentile(values, fraction):
+  # Nearest-rank percentile of an already sorted list
+  if not values:
+    return None
+  return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(name, method, path, samples, wall_time):
+  # samples: (seconds, status, queries or None, db milliseconds or None) per request
+  latencies = sorted(sample[0] * 1000 for sample in samples)
+  queries = [sample[2] for sample in samples if sample[2] is not None]
+  db_times = [sample[3] for sample in samples if sample[3] is not None]
+  return {
+    "name": name,
+    "method": method,
+    "path": path,
+    "requests": len(samples),
+    "errors": sum(1 for sample in samples if sample[1] >= 400),
+    "status": sorted({sample[1] for sample in samples}),
+    "throughput": round(len(samples) / wall_time, 1) if wall_time else None,
+    "p50_ms": round(percentile(latencies, 0.50), 2) if latencies else None,
+    "p95_ms": round(percentile(latencies, 0.95), 2) if latencies else None,
+    "p99_ms": round(percentile(latencies, 0.99), 2) if latencies else None,
+    "queries": round(sum(queries) / len(queries), 1) if queries else None,
+    "db_ms": round(sum(db_times) / len(db_times), 2) if db_times else None,
+  }
+
+
+def _server_timing(header):
+  match = SERVER_TIMING_DB.search(header or '')
+  return (int(match.group(2)), float(match.group(1))) if match else (None, None)
+
+
+def _metadata(app, extra):
+  try:
+    import git
+    commit = git.Repo(app.root_path, search_parent_directories=True).head.commit.hexsha
+  except Exception:
+    commit = None
+  return {
+    "commit": commit,
+    "database": db.engine.dialect.name,
+    "rows": {model.__tablename__: model.query.count() for model in (Area, Venue, Artist, Show)},
+    "cache": app.config['CACHE_ENABLED'],
+    "created": datetime.utcnow().isoformat(timespec='seconds'),
+    **extra,
+  }
+
+
+def time_route(app, client, scenario, requests, warmup):
+  name, method, path, data = scenario
+  for _ in range(warmup):
+    with app.app_context():
+      client.open(path, method=method, data=data)
+  samples, started = [], time.perf_counter()
+  for _ in range(requests):
+    began = time.perf_counter()
+    with app.app_context(): # A fresh context, and so a fresh session, per request as in production
+      response = client.open(path, method=method, data=data)
+    elapsed = time.perf_counter() - began
+    samples.append((elapsed, response.status_code) + _server_timing(response.headers.get('Server-Timing')))
+  return summarize(name, method, path, samples, time.perf_counter() - started)
+
+
+def run_test_client(app, requests, warmup):
+  # Sequential requests through the test client: latency without any network or server in the way
+  client = app.test_client()
+  found, skipped = scenarios(app)
+  results = [time_route(app, client, scenario, requests, warmup) for scenario in found]
+
+  for name, query in query_scenarios():
+    query()
+    samples, started = [], time.perf_counter()
+    for _ in range(requests):
+      began = time.perf_counter()
+      query()
+      samples.append((time.perf_counter() - began, 200, None, None))
+    results.append(summarize(name, 'QUERY', '', samples, time.perf_counter() - started))
+  return results, skipped
+
+
+def _fetch(url, method, data):
+  body = urllib.parse.urlencode(data).encode() if data else None
+  began = time.perf_counter()
+  try:
+    with urllib.request.urlopen(urllib.request.Request(url, data=body, method=method), timeout=60) as response:
+      response.read()
+      status, header = response.status, response.headers.get('Server-Timing')
+  except urllib.error.HTTPError as error:
+    status, header = error.code, error.headers.get('Server-Timing')
+  except (urllib.error.URLError, OSError):
+    status, header = 599, None # Connection failed or timed out
+  return (time.perf_counter() - began, status) + _server_timing(header)
+
+
+def run_http(app, base_url, requests, concurrency):
+  # Concurrent requests against a running server sharing this app's database
+  found, skipped = scenarios(app)
+  results = []
+  with ThreadPoolExecutor(max_workers=concurrency) as pool:
+    for name, method, path, data in found:
+      url = base_url.rstrip('/') + path
+      list(pool.map(lambda _: _fetch(url, method, data), range(concurrency))) # Warm every connection and worker
+      started = time.perf_counter()
+      samples = list(pool.map(lambda _: _fetch(url, method, data), range(requests)))
+      results.append(summarize(name, method, path, samples, time.perf_counter() - started))
+  return results, skipped
+
+def _free_port():
+  with socket.socket() as probe:
+    probe.bind(('127.0.0.1', 0))
+    return probe.getsockname()[1]
+
+
+def time_import(code, runs):
+  # Median seconds for a fresh interpreter to run `code`, interpreter start-up included
+  timings = []
+  for _ in range(runs):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=current_app.root_path)
+    timings.append(time.perf_counter() - started)
+  return statistics.median(timings)
+
+
+def time_worker_boot(runs, timeout=30):
+  # Median seconds from starting a one-worker gunicorn to its first response
+  timings = []
+  for _ in range(runs):
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', '1', '-b', '127.0.0.1:%d' % port, 'app:create_app()'],
+                              cwd=current_app.root_path, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+      while True:
+        if time.perf_counter() - started > timeout:
+          raise click.ClickException('gunicorn did not answer within %ds' % timeout)
+        try:
+          urllib.request.urlopen('http://127.0.0.1:%d/cache/stats' % port, timeout=1).read()
+          break
+        except (urllib.error.URLError, OSError):
+          time.sleep(0.01)
+      timings.append(time.perf_counter() - started)
+    finally:
+      server.terminate()
+      server.wait()
+  return statistics.median(timings)
+
+
+def legacy_format_datetime(value, format='medium'):
+  # The datetime filter before filters.py, kept as the baseline for `bench datetime`
+  date = dateutil.parser.parse(str(value))
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format, locale='en')
+
+
+def time_calls(call, calls):
+  # Microseconds per call, after one untimed call
+  call()
+  started = time.perf_counter()
+  for _ in range(calls):
+    call()
+  return (time.perf_counter() - started) * 1e6 / calls
+
+
+def add_located_venues(count, seed=0, chunk_size=10000):
+  # Bare venues (name, area, coordinates and cell) Core-inserted around the
+  # existing ones, to measure location queries at sizes the ORM seeder is too slow for
+  rng = random.Random(seed)
+  anchors = db.session.query(Venue.area_id, Venue.latitude, Venue.longitude).filter(Venue.geo_cell.isnot(None)).limit(10000).all()
+  if not anchors:
+    raise click.ClickException('No located venues to scatter new ones around; run `flask bench seed` first.')
+  for start in range(0, count, chunk_size):
+    rows = []
+    for number in range(start, min(start + chunk_size, count)):
+      area_id, latitude, longitude = rng.choice(anchors)
+      latitude, longitude = latitude + rng.uniform(-0.25, 0.25), longitude + rng.uniform(-0.3, 0.3)
+      rows.append({'name': 'Located %d' % number, 'area_id': area_id, 'latitude': latitude, 'longitude': longitude,
+                   'geo_cell': geo.cell(latitude, longitude)})
+    db.session.execute(insert(Venue.__table__), rows)
+    db.session.commit()
+
+
+def add_shows(count, chunk_size=10000, artist_id=None):
+  # Shows Core-inserted for the seeded venues and artists (or only
+  # `artist_id`), in 3-hour slots after every seeded show. Show n goes to
+  # venue n % venues and artist n % artists at slot n // min(venues,
+  # artists), so none double-books.
+  venue_ids = [venue_id for (venue_id,) in db.session.query(Venue.id).order_by(Venue.id)]
+  artist_ids = [artist_id] if artist_id else \
+    [artist for (artist,) in db.session.query(Artist.id).order_by(Artist.id)]
+  if not venue_ids or not artist_ids:
+    raise click.ClickException('No venues or artists to book; run `flask bench seed` first.')
+  latest = db.session.query(func.max(Show.end_time)).scalar() or datetime.utcnow()
+  first = latest.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+  per_slot = min(len(venue_ids), len(artist_ids))
+  for start in range(0, count, chunk_size):
+    rows = []
+    for number in range(start, min(start + chunk_size, count)):
+      start_time = first + timedelta(hours=3 * (number // per_slot))
+      rows.append({'venue_id': venue_ids[number % len(venue_ids)], 'artist_id': artist_ids[number % len(artist_ids)],
+                   'start_time': start_time, 'end_time': start_time + timedelta(hours=2)})
+    db.session.execute(insert(Show.__table__), rows)
+    db.session.commit()
+
+
+def add_search_venues(count, seed=0, chunk_size=10000):
+  # Bare venues (name, area and search document) Core-inserted into the
+  # seeded areas, to measure search at sizes the ORM seeder is too slow for
+  rng = random.Random(seed)
+  areas = db.session.query(Area.id, Area.city, Area.state).all()
+  if not areas:
+    raise click.ClickException('No areas to put new venues in; run `flask bench seed` first.')
+  for start in range(0, count, chunk_size):
+    rows = []
+    for number in range(start, min(start + chunk_size, count)):
+      area_id, city, state = rng.choice(areas)
+      name = 'The %s %d' % (' '.join(rng.sample(WORDS, 2)), number)
+      rows.append({'name': name, 'area_id': area_id, 'search_document': ' '.join(part for part in (name, city, state) if part)})
+    db.session.execute(insert(Venue.__table__), rows)
+    db.session.commit()
+
+
+def scan_within(latitude, longitude, radius_km, limit):
+  # The same answer as geo.within() from a scan of every venue, as a baseline
+  found = [(geo.distance_km(latitude, longitude, row.latitude, row.longitude), row.id)
+           for row in db.session.query(Venue.id, Venue.latitude, Venue.longitude)
+           .filter(Venue.archived_at.is_(None), Venue.latitude.isnot(None))]
+  return sorted(item for item in found if item[0] <= radius_km)[:limit]
+
+
+def peak_memory(call):
+  # (result, peak bytes allocated by Python while call() ran)
+  tracemalloc.start()
+  try:
+    result = call()
+    return result, tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+
+def stream_listing(app, path):
+  # (bytes, chunks) of a streamed page, consumed chunk by chunk as a server would send it
+  client = app.test_client()
+  response = client.get(path, buffered=False)
+  size = chunks = 0
+  try:
+    for chunk in response.response:
+      size += len(chunk)
+      chunks += 1
+  finally:
+    response.close()
+  return size, chunks
+
+
+def listing_queries():
+  # The queries behind the whole /shows and /artists listings, in listing order
+  from app import show_listing
+  return {
+    'shows': lambda: show_listing(Artist, Venue).filter(Artist.archived_at.is_(None), Venue.archived_at.is_(None),
+                                                         Show.start_time.isnot(None))
+                     .order_by(Show.venue_id, Show.start_time, Show.id),
+    'artists': lambda: db.session.query(Artist.id, Artist.name).filter(Artist.archived_at.is_(None)).order_by(Artist.id),
+  }
+
+
+def render_listing(app, template_name, name, query):
+  # Bytes of the same page built the way listings were before streaming: every row, then one string
+  with app.test_request_context():
+    return len(render_template(template_name, page=None, **{name: query().all()}).encode('utf-8')), 1
+
+#----------------------------------------------------------------------------#
+# Reports.
+#----------------------------------------------------------------------------#
+
+def _format_value(value):
+  return '-' if value is None else str(value)
+
+
+def print_report(results):
+  columns = ['throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'queries', 'db_ms', 'errors']
+  width = max([len(result['name']) for result in results] + [8])
+  click.echo('%-*s %s' % (width, 'scenario', ' '.join('%10s' % column for column in columns)))
+  for result in results:
+    click.echo('%-*s %s' % (width, result['name'], ' '.join('%10s' % _format_value(result[column]) for column in columns)))
+
+
+def _write_report(app, results, skipped, output, **extra):
+  print_report(results)
+  for rule in skipped:
+    click.echo('skipped %s (no sample row)' % rule, err=True)
+  if output:
+    with open(output, 'w') as stream:
+      json.dump({"meta": _metadata(app, extra), "results": results, "skipped": skipped}, stream, indent=2, sort_keys=True)
+    click.echo('Report written to %s' % output)
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@bench.command('seed')
+@click.option('--areas', default=50, show_default=True)
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=1000, show_default=True)
+@click.option('--shows', default=10000, show_default=True)
+@click.option('--seed', 'seed', default=0, show_default=True, help='Random seed; the same seed gives the same data.')
+@click.option('--reset', is_flag=True, help='Drop every table and rebuild the schema with the migrations first.')
+@click.option('--yes', is_flag=True, help='Do not ask before --reset drops the tables.')
+def seed_command(areas, venues, artists, shows, seed, reset, yes):
+  """Fill the database with generated areas, venues, artists and shows."""
+  if reset:
+    if not yes:
+      click.confirm('Drop every table in %s?' % db.engine.url.render_as_string(hide_password=True), abort=True)
+    reset_database()
+  elif Venue.query.first() is not None or Artist.query.first() is not None:
+    raise click.ClickException('The database already has data; use --reset to start from an empty one.')
+
+  started = time.perf_counter()
+  seed_database(areas, venues, artists, shows, seed=seed)
+  click.echo('Seeded %d areas, %d venues, %d artists and %d shows in %.1fs' % (
+    areas, venues, artists, shows, time.perf_counter() - started))
+
+
+@bench.command('run')
+@click.option('--requests', default=50, show_default=True, help='Timed requests per scenario.')
+@click.option('--warmup', default=5, show_default=True, help='Untimed requests per scenario first.')
+@click.option('--cache/--no-cache', default=False, show_default=True, help='Serve pages from the page cache.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the report as JSON.')
+def run_command(requests, warmup, cache, output):
+  """Time every route in-process through the Flask test client."""
+  app = current_app._get_current_object()
+  app.config['CACHE_ENABLED'] = cache
+  app.extensions['page_cache'].enabled = cache
+  results, skipped = run_test_client(app, requests, warmup)
+  _write_report(app, results, skipped, output)
+
+
+@bench.command('http')
+@click.argument('base_url')
+@click.option('--requests', default=200, show_default=True, help='Timed requests per scenario.')
+@click.option('--concurrency', default=8, show_default=True, help='Requests in flight at once.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the report as JSON.')
+def http_command(base_url, requests, concurrency, output):
+  """Load a running server (e.g. gunicorn 'app:create_app()') with concurrent requests."""
+  app = current_app._get_current_object()
+  results, skipped = run_http(app, base_url, requests, concurrency)
+  # The server's own settings (page cache included) are not visible from here
+  _write_report(app, results, skipped, output, cache=None, target=base_url, concurrency=concurrency)
+
+
+@bench.command('datetime')
+@click.option('--calls', default=20000, show_default=True)
+def datetime_command(calls):
+  """Compare the per-call cost of the datetime filter with its previous version."""
+  value = datetime(2030, 5, 21, 21, 30)
+  with current_app.test_request_context():
+    before = time_calls(lambda: legacy_format_datetime(value, 'full'), calls)
+    after = time_calls(lambda: format_datetime(value, 'full'), calls)
+  click.echo('previous filter  %8.2f us/call' % before)
+  click.echo('current filter   %8.2f us/call  (%.1fx faster)' % (after, before / after))
+
+
+@bench.command('detail')
+@click.option('--requests', default=200, show_default=True)
+@click.option('--warmup', default=10, show_default=True)
+@click.option('--workers', default=4, show_default=True, help='READ_POOL_WORKERS for the concurrent run.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Also write a JSON report.')
+def detail_command(requests, warmup, workers, output):
+  """Compare detail pages with their queries run in order and concurrently."""
+  app = current_app._get_current_object()
+  app.config['CACHE_ENABLED'] = False
+  app.extensions['page_cache'].enabled = False
+  read_pool = app.extensions['read_pool']
+  client = app.test_client()
+  found = [scenario for scenario in scenarios(app)[0] if scenario[0] in DETAIL_ENDPOINTS]
+  results = []
+  try:
+    for label, pool_size in (('sequential', 0), ('concurrent', workers)):
+      read_pool.resize(pool_size)
+      for name, method, path, data in found:
+        results.append(time_route(app, client, ('%s (%s)' % (name, label), method, path, data), requests, warmup))
+  finally:
+    read_pool.resize(app.config['READ_POOL_WORKERS'])
+  _write_report(app, results, [], output, read_pool_workers=workers)
+
+
+@bench.command('near')
+@click.option('--queries', default=200, show_default=True)
+@click.option('--radius', default=10.0, show_default=True, help='Kilometres, for the radius query.')
+@click.option('--limit', default=10, show_default=True, help='Venues per query.')
+@click.option('--add-venues', default=0, help='Core-insert this many located venues first.')
+@click.option('--scans', default=3, show_default=True, help='Full-scan baseline queries (0 to skip).')
+@click.option('--seed', default=0, show_default=True)
+def near_command(queries, radius, limit, add_venues, scans, seed):
+  """Time radius and nearest-venue queries on the grid cell index."""
+  if add_venues:
+    started = time.perf_counter()
+    add_located_venues(add_venues, seed=seed)
+    click.echo('Added %d located venues in %.1fs' % (add_venues, time.perf_counter() - started))
+  rng = random.Random(seed)
+  located = db.session.query(func.count(Venue.id)).filter(Venue.geo_cell.isnot(None)).scalar()
+  points = db.session.query(Venue.latitude, Venue.longitude).filter(Venue.geo_cell.isnot(None)) \
+    .order_by(Venue.id).limit(1000).all()
+  if not points:
+    raise click.ClickException('No located venues; run `flask bench seed` or `flask geocode-venues` first.')
+  # Query from near real venues, a few km off, like a visitor in town
+  points = [(latitude + rng.uniform(-0.05, 0.05), longitude + rng.uniform(-0.05, 0.05))
+            for latitude, longitude in (rng.choice(points) for _ in range(queries))]
+  max_radius = current_app.config['GEO_MAX_RADIUS_KM']
+
+  click.echo('%d located venues' % located)
+  cases = [
+    ('within %g km' % radius, lambda point: geo.within(point[0], point[1], radius, limit), points),
+    ('nearest %d' % limit, lambda point: geo.nearest(point[0], point[1], limit, max_radius), points),
+  ]
+  if scans:
+    cases.append(('within %g km, full scan' % radius, lambda point: scan_within(point[0], point[1], radius, limit), points[:scans]))
+  for label, query, sample in cases:
+    timings, sizes = [], []
+    for point in sample:
+      started = time.perf_counter()
+      sizes.append(len(query(point)))
+      timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    click.echo('%-26s p50 %8.2f ms  p95 %8.2f ms  %6.1f venues/query' % (
+      label, percentile(timings, 0.50), percentile(timings, 0.95), statistics.mean(sizes)))
+
+
+@bench.command('pages')
+@click.option('--sizes', default='1000,1000000', show_default=True, help='Show counts to measure at, ascending.')
+@click.option('--requests', default=50, show_default=True, help='Timed requests per page.')
+def pages_command(sizes, requests):
+  """Time /shows pages and their peak memory as shows are added up to each size."""
+  app = current_app._get_current_object()
+  app.config['CACHE_ENABLED'] = False
+  app.extensions['page_cache'].enabled = False
+  client = app.test_client()
+  for size in sorted(int(size) for size in sizes.split(',')):
+    existing = db.session.query(func.count(Show.id)).scalar()
+    if existing > size:
+      click.echo('Skipping %d shows: the database already has %d' % (size, existing))
+      continue
+    if existing < size:
+      started = time.perf_counter()
+      add_shows(size - existing)
+      click.echo('Added %d shows in %.1fs' % (size - existing, time.perf_counter() - started))
+    # The first page, and one starting at the middle show of the listing's order
+    middle = db.session.query(Show.venue_id, Show.start_time, Show.id).filter(Show.start_time.isnot(None)) \
+      .order_by(Show.venue_id, Show.start_time, Show.id).offset(size // 2).first()
+    paths = [('first page', '/shows'), ('middle page', '/shows?cursor=%s' % encode_cursor('next', list(middle)))]
+    for label, path in paths:
+      client.get(path) # Untimed, so template compilation isn't measured
+      timings = []
+      for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+          raise click.ClickException('%s answered %d' % (path, response.status_code))
+      _, peak = peak_memory(lambda: client.get(path))
+      timings.sort()
+      click.echo('%9d shows  %-12s p50 %8.2f ms  p95 %8.2f ms  %8.1f KB peak' % (
+        size, label, percentile(timings, 0.50), percentile(timings, 0.95), peak / 2**10))
+
+
+@bench.command('render')
+@click.option('--sizes', default='1000,10000,100000', show_default=True, help='Show counts to measure at, ascending.')
+@click.option('--runs', default=5, show_default=True, help='Timed runs per size.')
+def render_command(sizes, runs):
+  """Time loading and rendering the whole /shows listing as shows are added up to each size."""
+  app = current_app._get_current_object()
+  app.config['CACHE_ENABLED'] = False
+  app.extensions['page_cache'].enabled = False
+  query = listing_queries()['shows']
+  # What the listing used to load: full show, artist and venue rows (and their genres)
+  entities = lambda: db.session.query(Show, Artist, Venue).join(Artist, Artist.id == Show.artist_id) \
+    .join(Venue, Venue.id == Show.venue_id).filter(Artist.archived_at.is_(None), Venue.archived_at.is_(None),
+                                                    Show.start_time.isnot(None)) \
+    .order_by(Show.venue_id, Show.start_time, Show.id)
+
+  def render():
+    rows = query().all()
+    with app.test_request_context():
+      render_template('pages/shows.html', page=None, shows=rows)
+
+  cases = [
+    ('joined columns', lambda: query().all()),
+    ('full ORM rows', lambda: entities().all()),
+    ('query + render', render),
+    ('streamed', lambda: stream_listing(app, '/shows?all=1')),
+  ]
+  render() # Untimed, so template compilation isn't measured
+  for size in sorted(int(size) for size in sizes.split(',')):
+    existing = db.session.query(func.count(Show.id)).scalar()
+    if existing > size:
+      click.echo('Skipping %d shows: the database already has %d' % (size, existing))
+      continue
+    if existing < size:
+      started = time.perf_counter()
+      add_shows(size - existing)
+      click.echo('Added %d shows in %.1fs' % (size - existing, time.perf_counter() - started))
+    for label, call in cases:
+      timings = []
+      for _ in range(runs):
+        db.session.expunge_all() # Full rows are loaded afresh each run, not found in the identity map
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+      timings.sort()
+      click.echo('%9d shows  %-15s p50 %9.1f ms  %7.3f ms per 1000 shows' % (
+        size, label, percentile(timings, 0.50), percentile(timings, 0.50) * 1000 / size))
+
+
+@bench.command('inserts')
+@click.option('--sizes', default='100,1000,10000', show_default=True, help="The artist's show counts to measure at, ascending.")
+@click.option('--inserts', default=100, show_default=True, help='Timed shows POSTed per size.')
+def inserts_command(sizes, inserts):
+  """Time POST /shows/create for one artist as its shows are added up to each size."""
+  app = current_app._get_current_object()
+  app.config['CACHE_ENABLED'] = False
+  app.extensions['page_cache'].enabled = False
+  client = app.test_client()
+  artist_id = db.session.query(func.min(Artist.id)).scalar()
+  venue_ids = [venue_id for (venue_id,) in db.session.query(Venue.id).order_by(Venue.id)]
+  if artist_id is None or not venue_ids:
+    raise click.ClickException('No venues or artists to book; run `flask bench seed` first.')
+  for size in sorted(int(size) for size in sizes.split(',')):
+    existing = db.session.query(func.count(Show.id)).filter(Show.artist_id == artist_id).scalar()
+    if existing > size:
+      click.echo('Skipping %d shows: artist %d already has %d' % (size, artist_id, existing))
+      continue
+    if existing < size:
+      started = time.perf_counter()
+      add_shows(size - existing, artist_id=artist_id)
+      click.echo('Added %d shows for artist %d in %.1fs' % (size - existing, artist_id, time.perf_counter() - started))
+    # Free 3-hour slots after every show, each at the next venue
+    latest = db.session.query(func.max(Show.end_time)).scalar() or datetime.utcnow()
+    first = latest.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    db.session.close()
+    samples = []
+    for number in range(inserts):
+      start_time = first + timedelta(hours=3 * number)
+      data = {'artist_id': str(artist_id), 'venue_id': str(venue_ids[number % len(venue_ids)]),
+              'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+              'end_time': (start_time + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M:%S')}
+      began = time.perf_counter()
+      with app.app_context():
+        response = client.post('/shows/create', data=data)
+      elapsed = time.perf_counter() - began
+      if response.status_code != 302:
+        raise click.ClickException('/shows/create answered %d' % response.status_code)
+      samples.append((elapsed, response.status_code) + _server_timing(response.headers.get('Server-Timing')))
+    result = summarize('create show', 'POST', '/shows/create', samples, sum(sample[0] for sample in samples))
+    click.echo('%9d shows  p50 %8.2f ms  p95 %8.2f ms  %5s queries  %8s db ms' % (
+      size, result['p50_ms'], result['p95_ms'], result['queries'], result['db_ms']))
+
+
+@bench.command('search')
+@click.option('--sizes', default='10000,100000,1000000', show_default=True, help='Venue counts to measure at, ascending.')
+@click.option('--queries', default=50, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+def search_command(sizes, queries, seed):
+  """Time venue searches as venues are added up to each size."""
+  rng = random.Random(seed)
+  # Word prefixes, alone and in pairs, like terms typed into the search box
+  terms = [' '.join(word.lower()[:rng.randint(3, len(word))] for word in rng.sample(WORDS, rng.randint(1, 2)))
+           for _ in range(queries)]
+  cases = [
+    ('search', lambda term: search.search(Venue, term).total),
+    ('name ILIKE scan', lambda term: Venue.query.filter(Venue.name.ilike('%' + term + '%')).count()),
+  ]
+  for size in sorted(int(size) for size in sizes.split(',')):
+    existing = db.session.query(func.count(Venue.id)).scalar()
+    if existing > size:
+      click.echo('Skipping %d venues: the database already has %d' % (size, existing))
+      continue
+    if existing < size:
+      started = time.perf_counter()
+      add_search_venues(size - existing, seed=seed + size)
+      click.echo('Added %d venues in %.1fs' % (size - existing, time.perf_counter() - started))
+    for label, query in cases:
+      timings, matches = [], []
+      for term in terms:
+        started = time.perf_counter()
+        matches.append(query(term))
+        timings.append((time.perf_counter() - started) * 1000)
+      timings.sort()
+      click.echo('%9d venues  %-16s p50 %9.2f ms  p95 %9.2f ms  %9.1f matches/query' % (
+        size, label, percentile(timings, 0.50), percentile(timings, 0.95), statistics.mean(matches)))
+
+
+@bench.command('jobs')
+@click.option('--jobs', 'count', default=200, show_default=True)
+@click.option('--owners', default=50, show_default=True, help='Venues and artists per refresh-stats job.')
+def jobs_command(count, owners):
+  """Time a stats refresh run inline and queued, then drain the queue with a worker."""
+  app = current_app._get_current_object()
+  venue_ids = [venue_id for (venue_id,) in db.session.query(Venue.id).order_by(Venue.id).limit(owners)]
+  artist_ids = [artist_id for (artist_id,) in db.session.query(Artist.id).order_by(Artist.id).limit(owners)]
+  configured = app.config['JOBS_INLINE']
+  try:
+    # What a request pays: the job run in its transaction, or just the queue row
+    for label, inline in (('inline', True), ('queued', False)):
+      app.config['JOBS_INLINE'] = inline
+      timings = []
+      for _ in range(count):
+        started = time.perf_counter()
+        jobs.enqueue('refresh-stats', venue_ids=venue_ids, artist_ids=artist_ids)
+        db.session.commit()
+        timings.append((time.perf_counter() - started) * 1000)
+      timings.sort()
+      click.echo('%-8s enqueue + commit  p50 %8.2f ms  p95 %8.2f ms' % (
+        label, percentile(timings, 0.50), percentile(timings, 0.95)))
+  finally:
+    app.config['JOBS_INLINE'] = configured
+  started = time.perf_counter()
+  processed = jobs.work(burst=True)
+  elapsed = time.perf_counter() - started
+  click.echo('Worker ran %d jobs in %.2fs (%.0f jobs/s)' % (processed, elapsed, processed / elapsed if elapsed else 0))
+  click.echo(json.dumps(jobs.queue_stats(), indent=2))
+
+
+@bench.command('stream')
+@click.option('--listing', type=click.Choice(['shows', 'artists']), default='shows', show_default=True)
+@click.option('--max-peak', type=float, default=None, help='Fail if streaming peaks above this many MB.')
+@click.option('--buffered/--no-buffered', default=True, show_default=True, help='Also render the page in one piece to compare.')
+def stream_command(listing, max_peak, buffered):
+  """Measure peak memory while streaming a whole listing (?all=1)."""
+  app = current_app._get_current_object()
+  app.config['CACHE_ENABLED'] = False
+  queries = listing_queries()
+  rows = queries[listing]().count()
+  click.echo('%d %s' % (rows, listing))
+  results = [('streamed', stream_listing, (app, '/%s?all=1' % listing))]
+  if buffered:
+    results.append(('rendered whole', render_listing, (app, 'pages/%s.html' % listing, listing, queries[listing])))
+  streamed_peak = None
+  for label, measure, arguments in results:
+    started = time.perf_counter()
+    (size, chunks), peak = peak_memory(lambda: measure(*arguments))
+    elapsed = time.perf_counter() - started
+    streamed_peak = peak if streamed_peak is None else streamed_peak
+    click.echo('%-15s %9.1f MB peak  %9.1f MB sent in %6d chunks  %7.2f s (traced)' % (
+      label, peak / 2**20, size / 2**20, chunks, elapsed))
+  if max_peak is not None and streamed_peak > max_peak * 2**20:
+    raise click.ClickException('streaming peaked at %.1f MB, above --max-peak %.1f MB' % (streamed_peak / 2**20, max_peak))
+
+
+@bench.command('startup')
+@click.option('--runs', default=5, show_default=True)
+def startup_command(runs):
+  """Time importing the app, building it, and booting a gunicorn worker."""
+  baseline = time_import('pass', runs)
+  imported = time_import('import app', runs)
+  created = time_import('import app; app.create_app()', runs)
+  booted = time_worker_boot(runs)
+  click.echo('interpreter            %8.1f ms' % (baseline * 1000))
+  click.echo('import app             %8.1f ms  (+%.1f ms)' % (imported * 1000, (imported - baseline) * 1000))
+  click.echo('create_app()           %8.1f ms  (+%.1f ms)' % (created * 1000, (created - imported) * 1000))
+  click.echo('gunicorn worker boot   %8.1f ms  (to first response)' % (booted * 1000))
+
+
+@bench.command('compare')
+@click.argument('baseline', type=click.File())
+@click.argument('candidate', type=click.File())
+def compare_command(baseline, candidate):
+  """Show how each scenario changed between two JSON reports."""
+  before = {result['name']: result for result in json.load(baseline)['results']}
+  after = json.load(candidate)['results']
+  columns = ['p50_ms', 'p95_ms', 'p99_ms', 'throughput', 'queries']
+  width = max([len(result['name']) for result in after] + [8])
+  click.echo('%-*s %s' % (width, 'scenario', ' '.join('%22s' % column for column in columns)))
+  for result in after:
+    old = before.get(result['name'], {})
+    cells = []
+    for column in columns:
+      new_value, old_value = result.get(column), old.get(column)
+      if new_value is None or old_value is None:
+        cells.append('%22s' % _format_value(new_value))
+      else:
+        change = '%+.0f%%' % ((new_value - old_value) * 100.0 / old_value) if old_value else 'n/a'
+        cells.append('%22s' % ('%s -> %s (%s)' % (old_value, new_value, change)))
+    click.echo('%-*s %s' % (width, result['name'], ' '.join(cells)))
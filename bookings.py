@@ -0,0 +1,118 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from models import db, Show
+
+#----------------------------------------------------------------------------#
+# Booking conflicts.
+#----------------------------------------------------------------------------#
+
+# A venue hosts, and an artist plays, one show at a time: two shows of the
+# same venue or artist may not overlap ([start_time, end_time), so one may
+# start when the previous one ends). No show lasts longer than
+# SHOW_MAX_DURATION_HOURS, so the only shows that can overlap [start, end)
+# start after start - SHOW_MAX_DURATION_HOURS and before end: a bounded range
+# on the (venue_id, start_time) and (artist_id, start_time) indexes in the
+# database, and a bisect over a sorted list in process (Schedule). Either
+# way a check costs O(log n) plus the few shows in that window, never a scan.
+#
+# On PostgreSQL, exclusion constraints (see the add_show_end_time migration)
+# also reject overlaps that slip in between the check and the commit.
+
+OWNERS = [('venue_id', 'Venue'), ('artist_id', 'Artist')]
+
+
+def max_duration():
+  return timedelta(hours=current_app.config['SHOW_MAX_DURATION_HOURS'])
+
+
+def default_end_time(start_time):
+  return start_time + timedelta(minutes=current_app.config['SHOW_DEFAULT_DURATION_MINUTES'])
+
+
+class Schedule:
+  # The bookings of one venue or artist, sorted by start time
+
+  def __init__(self, max_duration):
+    self.max_duration = max_duration
+    self.starts = []
+    self.bookings = [] # (start_time, end_time, label), in the order of starts
+
+  def overlapping(self, start_time, end_time):
+    low = bisect_right(self.starts, start_time - self.max_duration)
+    high = bisect_left(self.starts, end_time)
+    return [booking for booking in self.bookings[low:high] if booking[1] > start_time]
+
+  def add(self, start_time, end_time, label):
+    position = bisect_right(self.starts, start_time)
+    self.starts.insert(position, start_time)
+    self.bookings.insert(position, (start_time, end_time, label))
+
+
+def _window(column, owner_ids, start_time, end_time, longest):
+  # Shows of owner_ids that overlap [start_time, end_time), as an index range
+  return and_(column.in_(owner_ids), Show.start_time > start_time - longest,
+              Show.start_time < end_time, Show.end_time > start_time)
+
+
+def _message(kind, label):
+  return '%s is already booked at that time (%s).' % (kind, label)
+
+
+def find_conflicts(artist_id, venue_id, start_time, end_time, exclude_id=None):
+  # {field: [messages]} for a new (or, with exclude_id, an edited) show; empty when it fits
+  longest = max_duration()
+  query = db.session.query(Show.id, Show.artist_id, Show.venue_id).filter(or_(
+    _window(Show.venue_id, [venue_id], start_time, end_time, longest),
+    _window(Show.artist_id, [artist_id], start_time, end_time, longest),
+  ))
+  if exclude_id is not None:
+    query = query.filter(Show.id != exclude_id)
+  owners = {'venue_id': venue_id, 'artist_id': artist_id}
+  errors = {}
+  for show in query.limit(10):
+    for field, kind in OWNERS:
+      if getattr(show, field) == owners[field]:
+        errors.setdefault(field, []).append(_message(kind, 'show %d' % show.id))
+  return errors
+
+
+def schedule_conflicts(bookings, labels):
+  # Validates a batch, e.g. one chunk of an import: bookings are dicts with
+  # artist_id, venue_id, start_time and end_time. Returns {label: {field:
+  # [messages]}} for each booking that overlaps an existing show or an
+  # earlier booking of the batch; the others can all be inserted together.
+  if not bookings:
+    return {}
+  longest = max_duration()
+  low = min(booking['start_time'] for booking in bookings)
+  high = max(booking['end_time'] for booking in bookings)
+
+  # Every existing show that can overlap the batch, with one windowed query
+  schedules = {field: defaultdict(lambda: Schedule(longest)) for field, _ in OWNERS}
+  owner_ids = {field: {booking[field] for booking in bookings} for field, _ in OWNERS}
+  existing = db.session.query(Show.id, Show.artist_id, Show.venue_id, Show.start_time, Show.end_time) \
+    .filter(or_(*[_window(getattr(Show, field), owner_ids[field], low, high, longest) for field, _ in OWNERS]))
+  for show in existing:
+    for field, _ in OWNERS:
+      if getattr(show, field) in owner_ids[field]:
+        schedules[field][getattr(show, field)].add(show.start_time, show.end_time, 'show %d' % show.id)
+
+  conflicts = {}
+  for booking, label in zip(bookings, labels):
+    errors = {}
+    for field, kind in OWNERS:
+      schedule = schedules[field][booking[field]]
+      overlaps = schedule.overlapping(booking['start_time'], booking['end_time'])
+      if overlaps:
+        errors[field] = [_message(kind, overlap[2]) for overlap in overlaps[:10]]
+    if errors:
+      conflicts[label] = errors
+      continue
+    for field, _ in OWNERS:
+      schedules[field][booking[field]].add(booking['start_time'], booking['end_time'], 'row %s' % label)
+  return conflicts
@@ -0,0 +1,162 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request, session
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class CacheBackend(ABC):
+  # The few operations the page cache needs. They map one-to-one onto
+  # Redis GET / SET EX / DEL / INCR, so a Redis-compatible client can be
+  # wrapped in a subclass and set as CACHE_BACKEND. A subclass missing one
+  # of them can't be instantiated.
+
+  @abstractmethod
+  def get(self, key):
+    pass
+
+  @abstractmethod
+  def set(self, key, value, ttl=None):
+    pass
+
+  @abstractmethod
+  def delete(self, key):
+    pass
+
+  @abstractmethod
+  def incr(self, key):
+    pass
+
+  def __len__(self):
+    return 0
+
+
+class LRUCache(CacheBackend):
+  # In-process backend: a bounded, thread-safe LRU with per-entry expiry.
+  # Each gunicorn worker keeps its own copy, so invalidations made by one
+  # worker reach the others only through the TTL.
+
+  def __init__(self, max_entries=1024, default_ttl=None):
+    self.max_entries = max_entries
+    self.default_ttl = default_ttl
+    self._entries = OrderedDict() # key -> (expires_at or None, value)
+    self._counters = {} # Kept apart so eviction can never reset a tag version
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      if key in self._counters:
+        return self._counters[key]
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      expires_at, value = entry
+      if expires_at is not None and expires_at <= time.monotonic():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl=None):
+    ttl = ttl if ttl is not None else self.default_ttl
+    with self._lock:
+      self._entries[key] = (time.monotonic() + ttl if ttl else None, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def delete(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+      self._counters.pop(key, None)
+
+  def incr(self, key):
+    with self._lock:
+      self._counters[key] = self._counters.get(key, 0) + 1
+      return self._counters[key]
+
+  def __len__(self):
+    return len(self._entries)
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+class PageCache:
+  # Caches whole rendered GET responses. Every cached page declares the tags
+  # it depends on ('venues', 'venue:{venue_id}', ...) and the version of each
+  # tag becomes part of the cache key, so invalidating a tag is a single
+  # counter increment and stale pages simply stop being addressed.
+
+  def __init__(self, app=None):
+    self.backend = None
+    self.ttl = None
+    self.enabled = False
+    self.hits = 0
+    self.misses = 0
+    self._varies = []
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.ttl = app.config['CACHE_TTL']
+    self.backend = app.config.get('CACHE_BACKEND')
+    if self.backend is None: # Not `or`: an empty backend has len() 0
+      self.backend = LRUCache(app.config['CACHE_MAX_ENTRIES'], default_ttl=self.ttl)
+    self.enabled = app.config['CACHE_ENABLED']
+    app.extensions['page_cache'] = self
+
+  def vary(self, func):
+    # Like an HTTP Vary header: func() is called per request and becomes part
+    # of the key, for pages that also depend on e.g. the negotiated locale
+    self._varies.append(func)
+    return func
+
+  def _key(self, tags):
+    versions = ','.join('%s=%s' % (tag, self.backend.get('tag:' + tag) or 0) for tag in tags)
+    varies = '|'.join(str(func()) for func in self._varies)
+    return 'page:%s|%s|%s' % (request.full_path, varies, versions)
+
+  def cached(self, *tags):
+    # `tags` may reference view arguments, e.g. cached('venue:{venue_id}')
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        # Pages rendered with pending flash messages are personal; don't cache or serve them
+        if not self.enabled or request.method != 'GET' or session.get('_flashes'):
+          return view(*args, **kwargs)
+
+        key = self._key([tag.format(**kwargs) for tag in tags])
+        entry = self.backend.get(key)
+        if entry is not None:
+          self.hits += 1
+          body, status, mimetype = entry
+          return Response(body, status=status, mimetype=mimetype)
+
+        self.misses += 1
+        response = view(*args, **kwargs)
+        if not isinstance(response, Response):
+          response = Response(response)
+        if response.status_code == 200 and not response.is_streamed:
+          self.backend.set(key, (response.get_data(), response.status_code, response.mimetype), ttl=self.ttl)
+        return response
+      return wrapper
+    return decorator
+
+  def invalidate(self, *tags):
+    for tag in tags:
+      self.backend.incr('tag:' + tag)
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_ratio": self.hits / lookups if lookups else 0.0,
+      "entries": len(self.backend),
+    }
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+from flask import current_app, g, has_request_context, request
+
+#----------------------------------------------------------------------------#
+# Date and time formatting.
+#----------------------------------------------------------------------------#
+
+# The `datetime` template filter runs once per show tile, so everything that
+# doesn't depend on the value being formatted (the Locale object and the
+# compiled Babel pattern) is built once per (format, locale) and reused.
+#
+# The locale is negotiated per request from Accept-Language among
+# SUPPORTED_LOCALES, and the timezone comes from the TIMEZONE_COOKIE cookie
+# (an IANA name such as 'Europe/Berlin', e.g. set by the browser from
+# Intl.DateTimeFormat().resolvedOptions().timeZone). Stored times are naive UTC.
+
+# Named formats the templates use; any other name is a Babel pattern or a
+# Babel named format ('long', 'short')
+FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+BABEL_NAMED_FORMATS = ('full', 'long', 'medium', 'short')
+
+
+@lru_cache(maxsize=256)
+def _compiled(format, locale):
+  # (pattern or None for a Babel named format, Locale)
+  pattern = FORMATS.get(format, format)
+  compiled = None if pattern in BABEL_NAMED_FORMATS else babel.dates.parse_pattern(pattern)
+  return compiled, Locale.parse(locale)
+
+
+@lru_cache(maxsize=128)
+def _timezone(name):
+  return babel.dates.get_timezone(name) # LookupError for unknown names
+
+
+def request_locale():
+  if not has_request_context():
+    return current_app.config['BABEL_DEFAULT_LOCALE']
+  if 'locale' not in g:
+    g.locale = request.accept_languages.best_match(current_app.config['SUPPORTED_LOCALES']) \
+      or current_app.config['BABEL_DEFAULT_LOCALE']
+  return g.locale
+
+
+def request_timezone():
+  default = current_app.config['BABEL_DEFAULT_TIMEZONE']
+  if not has_request_context():
+    return default
+  if 'timezone' not in g:
+    name = request.cookies.get(current_app.config['TIMEZONE_COOKIE'])
+    try:
+      g.timezone = name if name and _timezone(name) else default
+    except LookupError:
+      g.timezone = default
+  return g.timezone
+
+
+def format_datetime(value, format='medium', locale=None, tzinfo=None):
+  if value is None:
+    return ''
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(str(value)) # Strings are still accepted, but datetimes skip parsing
+  pattern, locale = _compiled(format, locale or request_locale())
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=timezone.utc)
+  value = value.astimezone(_timezone(tzinfo or request_timezone()))
+  if pattern is None:
+    return babel.dates.format_datetime(value, format, locale=locale)
+  return pattern.apply(value, locale)
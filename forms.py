@@ -1,7 +1,11 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from flask import current_app
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, FloatField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange, Optional, ValidationError
+
+# Accepted start/end time inputs: what the importer and the form placeholder use, and <input type="datetime-local">
+SHOW_TIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M']
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -13,9 +17,24 @@ class ShowForm(Form):
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default= datetime.today()
+        default= datetime.today(),
+        format=SHOW_TIME_FORMATS
+    )
+    # Defaults to SHOW_DEFAULT_DURATION_MINUTES after the start when left empty
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()],
+        format=SHOW_TIME_FORMATS
     )
 
+    def validate_end_time(form, field):
+        if field.data is None or form.start_time.data is None:
+            return
+        if field.data <= form.start_time.data:
+            raise ValidationError('The end time must be after the start time.')
+        if field.data - form.start_time.data > timedelta(hours=current_app.config['SHOW_MAX_DURATION_HOURS']):
+            raise ValidationError('Shows can last at most %d hours.' % current_app.config['SHOW_MAX_DURATION_HOURS'])
+
 class VenueForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -126,6 +145,14 @@ class VenueForm(Form):
         'seeking_description'
     )
 
+    # Geocoded from the city when left empty (see geo.py)
+    latitude = FloatField(
+        'latitude', validators=[Optional(), NumberRange(-90, 90)]
+    )
+    longitude = FloatField(
+        'longitude', validators=[Optional(), NumberRange(-180, 180)]
+    )
+
 
 
 class ArtistForm(Form):
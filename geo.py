@@ -0,0 +1,207 @@
+import csv
+import math
+import os
+from functools import lru_cache
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import case, event, inspect, or_
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from models import db, Venue
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#----------------------------------------------------------------------------#
+
+# Venues keep a latitude and longitude, supplied on the forms or on import,
+# or geocoded offline from the city centroids in data/us_cities.csv when left
+# out. Each venue also stores the cell of a fixed CELL_DEGREES grid it falls
+# in (geo_cell, row-major from the south-west corner), kept up to date before
+# every flush. A radius search turns into one BETWEEN range of cells per grid
+# row on the geo_cell index, which works the same on SQLite and PostgreSQL
+# without PostGIS. Within those cells the database keeps the venues inside
+# the radius by a flat-earth (equirectangular) distance and returns only the
+# nearest few by it, which are then measured exactly.
+
+CELL_DEGREES = 0.1 # About 11 km north to south; changing it means recomputing every geo_cell
+LATITUDE_CELLS = int(round(180 / CELL_DEGREES))
+LONGITUDE_CELLS = int(round(360 / CELL_DEGREES))
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# The flat-earth distance is off by up to a few percent at the radii allowed
+# (GEO_MAX_RADIUS_KM), so the database keeps venues up to this much further
+# and returns this many times the venues asked for, to be measured exactly
+APPROXIMATION_MARGIN = 1.05
+CANDIDATES_PER_RESULT = 2
+
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'us_cities.csv')
+
+
+def coordinates(latitude, longitude):
+  # (latitude, longitude) when both are given and on the globe, otherwise (None, None)
+  if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+    return None, None
+  return latitude, longitude
+
+
+def cell(latitude, longitude):
+  row = min(int((latitude + 90) / CELL_DEGREES), LATITUDE_CELLS - 1)
+  column = min(int((longitude + 180) / CELL_DEGREES), LONGITUDE_CELLS - 1)
+  return row * LONGITUDE_CELLS + column
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+  # Great-circle (haversine) distance
+  latitude1, longitude1, latitude2, longitude2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+  a = math.sin((latitude2 - latitude1) / 2) ** 2 \
+    + math.cos(latitude1) * math.cos(latitude2) * math.sin((longitude2 - longitude1) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_ranges(latitude, longitude, radius_km):
+  # Inclusive (first, last) geo_cell ranges covering every point within radius_km
+  south = max(-90.0, latitude - radius_km / KM_PER_DEGREE)
+  north = min(90.0, latitude + radius_km / KM_PER_DEGREE)
+  widest = max(abs(south), abs(north))
+  if widest >= 90 or radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest))) >= 180:
+    spans = [(-180.0, 180.0)] # Near a pole, or wide enough to go all the way round
+  else:
+    half_width = radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    west, east = longitude - half_width, longitude + half_width
+    # Spans go west to east in cell order, so the ranges below come out sorted
+    if west < -180:
+      spans = [(-180.0, east), (west + 360, 180.0)]
+    elif east > 180:
+      spans = [(-180.0, east - 360), (west, 180.0)]
+    else:
+      spans = [(west, east)]
+
+  ranges = []
+  for row in range(cell(south, 0) // LONGITUDE_CELLS, cell(north, 0) // LONGITUDE_CELLS + 1):
+    for west, east in spans:
+      first = row * LONGITUDE_CELLS + cell(0, west) % LONGITUDE_CELLS
+      last = row * LONGITUDE_CELLS + cell(0, east) % LONGITUDE_CELLS
+      if ranges and first <= ranges[-1][1] + 1: # Whole rows run into each other
+        ranges[-1] = (ranges[-1][0], max(last, ranges[-1][1]))
+      else:
+        ranges.append((first, last))
+  return ranges
+
+
+@lru_cache(maxsize=1)
+def _cities():
+  with open(CITIES_PATH, newline='', encoding='utf-8') as stream:
+    return {(row['city'].lower(), row['state'].upper()): (float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(stream)}
+
+
+def geocode(city, state):
+  # The centroid of a bundled city, or None
+  return _cities().get(((city or '').strip().lower(), (state or '').strip().upper()))
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def _flat_distance(latitude, longitude):
+  # Squared equirectangular distance from the point, in degrees of latitude,
+  # as SQL; longitudes are measured the short way round the antimeridian
+  east = Venue.longitude - longitude
+  east = case((east > 180, east - 360), (east < -180, east + 360), else_=east)
+  north = Venue.latitude - latitude
+  scale = math.cos(math.radians(latitude)) ** 2
+  return north * north + east * east * scale
+
+
+def within(latitude, longitude, radius_km, limit):
+  # [(distance_km, venue id)] of the `limit` active venues within radius_km nearest the point, nearest first
+  ranges = cell_ranges(latitude, longitude, radius_km)
+  flat = _flat_distance(latitude, longitude)
+  candidates = db.session.query(Venue.id, Venue.latitude, Venue.longitude) \
+    .filter(Venue.archived_at.is_(None), or_(*[Venue.geo_cell.between(first, last) for first, last in ranges]),
+            flat <= (radius_km * APPROXIMATION_MARGIN / KM_PER_DEGREE) ** 2) \
+    .order_by(flat, Venue.id).limit(limit * CANDIDATES_PER_RESULT)
+  found = []
+  for venue_id, venue_latitude, venue_longitude in candidates:
+    distance = distance_km(latitude, longitude, venue_latitude, venue_longitude)
+    if distance <= radius_km:
+      found.append((distance, venue_id))
+  found.sort()
+  return found[:limit]
+
+
+def nearest(latitude, longitude, limit, max_radius_km):
+  # The `limit` nearest active venues up to max_radius_km away. The search
+  # radius grows from one cell until it holds enough venues: everything
+  # inside a radius is measured, so the first `limit` of them are the nearest.
+  radius_km = CELL_DEGREES * KM_PER_DEGREE
+  while True:
+    radius_km = min(radius_km, max_radius_km)
+    found = within(latitude, longitude, radius_km, limit)
+    if len(found) >= limit or radius_km >= max_radius_km:
+      return found
+    radius_km *= 4
+
+
+def load_venues(found):
+  # The Venue rows of within()/nearest() results, in the same order
+  ids = [venue_id for _, venue_id in found]
+  venues = Venue.query.options(joinedload(Venue.area), selectinload(Venue.genres)).filter(Venue.id.in_(ids)).all()
+  by_id = {venue.id: venue for venue in venues}
+  return [by_id[venue_id] for venue_id in ids if venue_id in by_id]
+
+#----------------------------------------------------------------------------#
+# Maintenance.
+#----------------------------------------------------------------------------#
+
+def locate(venue):
+  # Fills in missing coordinates from the venue's city and recomputes its cell
+  state = inspect(venue)
+  moved = state.attrs.area.history.has_changes() or state.attrs.area_id.history.has_changes()
+  placed = state.attrs.latitude.history.has_changes() or state.attrs.longitude.history.has_changes()
+  if moved and not placed and not state.pending:
+    # A venue that changed city without new coordinates moves to the new city's centroid, if known
+    point = geocode(venue.area.city, venue.area.state) if venue.area is not None else None
+    venue.latitude, venue.longitude = point or (None, None)
+  elif venue.latitude is None or venue.longitude is None:
+    point = geocode(venue.area.city, venue.area.state) if venue.area is not None else None
+    if point is not None:
+      venue.latitude, venue.longitude = point
+  venue.geo_cell = cell(venue.latitude, venue.longitude) \
+    if venue.latitude is not None and venue.longitude is not None else None
+
+
+def _locate_venues(session, flush_context, instances):
+  for target in list(session.new) + list(session.dirty):
+    if isinstance(target, Venue):
+      locate(target)
+
+
+event.listen(Session, 'before_flush', _locate_venues)
+
+
+@click.command('geocode-venues')
+@click.option('--chunk-size', default=1000, show_default=True)
+@with_appcontext
+def geocode_venues_command(chunk_size):
+  """Fill in venue coordinates from the bundled city centroids and recompute grid cells."""
+  located = missing = 0
+  last_id = 0
+  while True:
+    venues = Venue.query.options(joinedload(Venue.area)).filter(Venue.id > last_id) \
+      .order_by(Venue.id).limit(chunk_size).all()
+    if not venues:
+      break
+    for venue in venues:
+      locate(venue)
+      if venue.geo_cell is None:
+        missing += 1
+      else:
+        located += 1
+    last_id = venues[-1].id
+    db.session.commit()
+  click.echo('%d venues located, %d without coordinates (city not in %s)' % (
+    located, missing, os.path.relpath(CITIES_PATH, current_app.root_path)))
@@ -0,0 +1,294 @@
+import csv
+import hmac
+import io
+import json
+import time
+from itertools import islice
+
+import click
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask.cli import with_appcontext
+from sqlalchemy import insert, tuple_
+from werkzeug.datastructures import MultiDict
+from wtforms import BooleanField
+
+import bookings
+import jobs
+import stats # Registers the refresh-stats job
+from forms import ArtistForm, ShowForm, VenueForm
+from models import db, Area, Artist, Genre, Show, Venue
+
+#----------------------------------------------------------------------------#
+# Bulk import of venues, artists and shows.
+#----------------------------------------------------------------------------#
+
+# Rows are streamed from CSV or JSON Lines, validated with the same forms the
+# create pages use, and written in chunks of IMPORT_CHUNK_SIZE rows, one
+# transaction per chunk. Areas, genres and foreign keys are resolved once per
+# chunk instead of once per row. A row that fails validation is reported and
+# skipped; it never rolls back the rest of its chunk.
+
+FORMS = {
+  'venues': VenueForm,
+  'artists': ArtistForm,
+  'shows': ShowForm,
+}
+
+# Checkbox fields of each form, and how spelled-out booleans say "unticked"
+BOOLEAN_FIELDS = {kind: {name for name, field in vars(form).items() if getattr(field, 'field_class', None) is BooleanField}
+                  for kind, form in FORMS.items()}
+FALSE_VALUES = ('', '0', 'false', 'no', 'n', 'off')
+
+
+class ImportReport:
+  def __init__(self, kind):
+    self.kind = kind
+    self.rows = 0
+    self.inserted = 0
+    self.errors = [] # (row number, {field: [messages]})
+    self.started = time.perf_counter()
+    self.seconds = 0.0
+
+  @property
+  def rows_per_second(self):
+    return self.rows / self.seconds if self.seconds else 0.0
+
+  def as_dict(self):
+    return {
+      "kind": self.kind,
+      "rows": self.rows,
+      "inserted": self.inserted,
+      "seconds": round(self.seconds, 3),
+      "rows_per_second": round(self.rows_per_second, 1),
+      "errors": [{"row": row, "errors": errors} for row, errors in self.errors],
+    }
+
+
+def read_rows(stream, format):
+  # Yields one dict per input row without reading the whole input into memory
+  if format == 'csv':
+    for row in csv.DictReader(stream):
+      if row.get('genres'):
+        row['genres'] = [genre.strip() for genre in row['genres'].split(',')]
+      yield row
+  elif format == 'jsonl':
+    for line in stream:
+      if line.strip():
+        try:
+          yield json.loads(line)
+        except ValueError:
+          yield line # Reported as an invalid row
+  else:
+    raise ValueError('Unknown import format: %s' % format)
+
+
+def _formdata(row, booleans):
+  # Forms expect posted strings: lists become repeated keys, and a checkbox is
+  # 'y' when ticked (CSV gives "False" or "TRUE", JSON true or false)
+  formdata = MultiDict()
+  for key, value in row.items():
+    if isinstance(value, list):
+      for item in value:
+        formdata.add(key, str(item))
+    elif key in booleans or isinstance(value, bool):
+      ticked = value.strip().lower() not in FALSE_VALUES if isinstance(value, str) else bool(value)
+      if ticked:
+        formdata.add(key, 'y')
+    elif value is not None:
+      formdata.add(key, str(value))
+  return formdata
+
+
+def _validate(kind, number, row, report):
+  if not isinstance(row, dict):
+    report.errors.append((number, {'row': ['Not a JSON object.']}))
+    return None
+  form = FORMS[kind](formdata=_formdata(row, BOOLEAN_FIELDS[kind]), meta={'csrf': False})
+  if form.validate():
+    return form.data
+  report.errors.append((number, form.errors))
+  return None
+
+#----------------------------------------------------------------------------#
+# Chunk writers.
+#----------------------------------------------------------------------------#
+
+def _area_key(row):
+  return (row['city'] or '', row['state'] or '') # As Area stores them
+
+
+def _resolve_areas(pairs):
+  # Every (city, state) of a chunk: the existing areas with one query, then
+  # the new ones through Area.get_or_create, whose ON CONFLICT insert lets
+  # concurrent imports (and forms) add the same area
+  pairs = set(pairs)
+  condition = tuple_(Area.city, Area.state).in_(pairs)
+  areas = {(area.city, area.state): area for area in Area.query.filter(condition).all()}
+  for city, state in pairs - set(areas):
+    areas[(city, state)] = Area.get_or_create(city, state)
+  return areas
+
+
+def _resolve_genres(rows):
+  genres = Genre.from_names({name for row in rows for name in row['genres']})
+  return {genre.name: genre for genre in genres}
+
+
+def _write_venues(rows):
+  # ORM objects are used here because the junction table needs the new venue
+  # ids; the flush batches them into executemany inserts.
+  areas = _resolve_areas(_area_key(row) for row in rows)
+  genres = _resolve_genres(rows)
+  db.session.add_all([
+    Venue(name=row['name'], address=row['address'], phone=row['phone'], image_link=row['image_link'],
+          genres=[genres[name] for name in row['genres']], facebook_link=row['facebook_link'],
+          website_link=row['website_link'], seeking_talent=row['seeking_talent'],
+          seeking_description=row['seeking_description'], area=areas[_area_key(row)],
+          latitude=row['latitude'], longitude=row['longitude']) # Geocoded from the city when missing (see geo.py)
+    for row in rows
+  ])
+  return len(rows), ['venues']
+
+
+def _write_artists(rows):
+  genres = _resolve_genres(rows)
+  db.session.add_all([
+    Artist(name=row['name'], city=row['city'], state=row['state'], phone=row['phone'],
+           image_link=row['image_link'], genres=[genres[name] for name in row['genres']],
+           facebook_link=row['facebook_link'], website_link=row['website_link'],
+           seeking_venue=row['seeking_venue'], seeking_description=row['seeking_description'])
+    for row in rows
+  ])
+  return len(rows), ['artists']
+
+
+def _write_shows(rows, numbers, report):
+  # Shows are plain rows, so they go straight to a Core executemany insert
+  # after their artist and venue ids are checked with one query each and
+  # their times with one more (see bookings.schedule_conflicts)
+  artist_ids = {int(row['artist_id']) for row in rows if row['artist_id'].isdigit()}
+  venue_ids = {int(row['venue_id']) for row in rows if row['venue_id'].isdigit()}
+  # Archived artists and venues can't be booked, as on the show form
+  artist_ids = {artist_id for (artist_id,) in Artist.active().with_entities(Artist.id).filter(Artist.id.in_(artist_ids))}
+  venue_ids = {venue_id for (venue_id,) in Venue.active().with_entities(Venue.id).filter(Venue.id.in_(venue_ids))}
+
+  values = []
+  for number, row in zip(numbers, rows):
+    artist_id = int(row['artist_id']) if row['artist_id'].isdigit() else None
+    venue_id = int(row['venue_id']) if row['venue_id'].isdigit() else None
+    if artist_id not in artist_ids or venue_id not in venue_ids:
+      errors = {}
+      if artist_id not in artist_ids:
+        errors['artist_id'] = ['Unknown artist.']
+      if venue_id not in venue_ids:
+        errors['venue_id'] = ['Unknown venue.']
+      report.errors.append((number, errors))
+      continue
+    values.append({'artist_id': artist_id, 'venue_id': venue_id, 'start_time': row['start_time'],
+                   'end_time': row['end_time'] or bookings.default_end_time(row['start_time']), 'number': number})
+
+  # The chunk's schedule is checked against itself and the shows already booked
+  # in its time window at once; a row that overlaps either is reported and skipped
+  conflicts = bookings.schedule_conflicts(values, [value['number'] for value in values])
+  report.errors.extend(conflicts.items())
+  values = [value for value in values if value.pop('number') not in conflicts]
+
+  if values:
+    db.session.execute(insert(Show.__table__), values)
+    # Core inserts bypass the flush hooks, so the counters are refreshed by a
+    # job committed with the chunk (run right here with JOBS_INLINE)
+    jobs.enqueue('refresh-stats', venue_ids=sorted({value['venue_id'] for value in values}),
+                 artist_ids=sorted({value['artist_id'] for value in values}))
+  stale = ['shows', 'venues'] + ['venue:%s' % v for v in {value['venue_id'] for value in values}] \
+    + ['artist:%s' % a for a in {value['artist_id'] for value in values}]
+  return len(values), stale
+
+
+def import_rows(kind, rows, chunk_size=None):
+  # Validates and inserts an iterable of row dicts; returns an ImportReport
+  if kind not in FORMS:
+    raise ValueError('Unknown import kind: %s' % kind)
+  chunk_size = chunk_size or current_app.config['IMPORT_CHUNK_SIZE']
+  page_cache = current_app.extensions.get('page_cache')
+  report = ImportReport(kind)
+  numbered = enumerate(rows, start=1)
+
+  while True:
+    chunk = list(islice(numbered, chunk_size))
+    if not chunk:
+      break
+    report.rows += len(chunk)
+
+    valid, numbers = [], []
+    for number, row in chunk:
+      data = _validate(kind, number, row, report)
+      if data is not None:
+        valid.append(data)
+        numbers.append(number)
+    if not valid:
+      continue
+
+    try:
+      if kind == 'venues':
+        inserted, stale = _write_venues(valid)
+      elif kind == 'artists':
+        inserted, stale = _write_artists(valid)
+      else:
+        inserted, stale = _write_shows(valid, numbers, report)
+      db.session.commit()
+    except Exception as error:
+      db.session.rollback()
+      report.errors.extend((number, {'chunk': [str(error)]}) for number in numbers)
+      continue
+    report.inserted += inserted
+    if page_cache is not None:
+      page_cache.invalidate(*stale)
+
+  report.errors.sort(key=lambda error: error[0])
+  report.seconds = time.perf_counter() - report.started
+  return report
+
+#----------------------------------------------------------------------------#
+# Entry points.
+#----------------------------------------------------------------------------#
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(FORMS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', type=int, help='Rows per transaction (IMPORT_CHUNK_SIZE).')
+@with_appcontext
+def import_command(kind, path, format, chunk_size):
+  """Bulk import venues, artists or shows from a CSV or JSON Lines file."""
+  format = format or ('csv' if path.endswith('.csv') else 'jsonl')
+  with open(path, newline='', encoding='utf-8') as stream:
+    report = import_rows(kind, read_rows(stream, format), chunk_size)
+
+  for row, errors in report.errors:
+    click.echo('row %d: %s' % (row, json.dumps(errors)), err=True)
+  click.echo('Imported %d of %d %s in %.2fs (%.0f rows/s)' % (
+    report.inserted, report.rows, kind, report.seconds, report.rows_per_second))
+
+
+import_api = Blueprint('import_api', __name__)
+
+
+@import_api.route('/api/import/<kind>', methods=['POST'])
+def import_endpoint(kind):
+  # Authenticated with `Authorization: Bearer <IMPORT_API_TOKEN>`; disabled when no token is configured.
+  # The body is JSON Lines (streamed) or, with Content-Type application/json, a JSON array of rows.
+  token = current_app.config.get('IMPORT_API_TOKEN')
+  if not token:
+    abort(404)
+  if not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+    abort(401)
+  if kind not in FORMS:
+    abort(404)
+
+  if request.mimetype == 'application/json':
+    rows = request.get_json()
+    if not isinstance(rows, list):
+      abort(400)
+  else:
+    rows = read_rows(io.TextIOWrapper(request.stream, encoding='utf-8'), 'jsonl')
+  return jsonify(import_rows(kind, rows).as_dict())
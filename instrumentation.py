@@ -0,0 +1,142 @@
+import re
+import threading
+import time
+from collections import Counter
+from functools import partial
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Per-request SQL and template instrumentation.
+#----------------------------------------------------------------------------#
+
+# Collapses expanded IN lists ("IN (?, ?, ?)") so statements that differ only
+# in the number of bound values have the same shape
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))+\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+  return PLACEHOLDER_LIST.sub('(...)', WHITESPACE.sub(' ', statement).strip())
+
+
+class RequestStats:
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.lock = threading.Lock() # Queries also run in read pool threads (readpool.py)
+    self.query_count = 0
+    self.query_time = 0.0 # Seconds
+    self.shapes = Counter()
+    self.reported_shapes = set()
+    self.render_started = [] # Stack: templates may render other templates
+    self.render_count = 0
+    self.render_time = 0.0 # Seconds, including any queries run from the template
+    self.compile_count = 0
+    self.compile_time = 0.0 # Seconds spent compiling template source (not bytecode cache hits)
+
+  def merge(self, other):
+    # Adds the queries a read pool thread ran for this request (readpool.py)
+    with self.lock:
+      self.query_count += other.query_count
+      self.query_time += other.query_time
+      self.shapes.update(other.shapes)
+
+
+class QueryInstrumentation:
+  # Counts statements and database time per request via SQLAlchemy cursor
+  # events, reports them in a Server-Timing header, logs statements slower
+  # than SLOW_QUERY_MS and warns when one statement shape repeats more than
+  # N_PLUS_ONE_THRESHOLD times in a single request (the N+1 pattern).
+  # Template render and compile times are reported alongside.
+  #
+  # Listeners go on each app's own engines (so after db.init_app), and report
+  # with that app's thresholds and logger.
+
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.extensions['query_instrumentation'] = self
+    if not app.config['INSTRUMENTATION_ENABLED']:
+      return
+
+    with app.app_context():
+      engines = list(app.extensions['sqlalchemy'].engines.values())
+    for engine in engines:
+      event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+      event.listen(engine, 'after_cursor_execute', partial(self._after_cursor_execute, app))
+      event.listen(engine, 'handle_error', self._handle_error)
+    app.before_request(self._start_request)
+    app.after_request(self._finish_request)
+    before_render_template.connect(self._before_render, app)
+    template_rendered.connect(self._after_render, app)
+    app.jinja_env.compile = self._timed_compile(app.jinja_env.compile)
+
+  def _start_request(self):
+    g.request_stats = RequestStats()
+
+  def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append((context, time.perf_counter()))
+
+  def _after_cursor_execute(self, app, conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()[1]
+    route = (request.endpoint or request.path) if has_request_context() else None
+
+    if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+      app.logger.warning('Slow query (%.1f ms) in %s: %s', elapsed * 1000, route or '<no request>', statement)
+
+    stats = g.get('request_stats') if has_request_context() else None
+    if stats is None:
+      return
+    threshold, shape = app.config['N_PLUS_ONE_THRESHOLD'], statement_shape(statement)
+    with stats.lock:
+      stats.query_count += 1
+      stats.query_time += elapsed
+      stats.shapes[shape] += 1
+      report = stats.shapes[shape] > threshold and shape not in stats.reported_shapes
+      if report:
+        stats.reported_shapes.add(shape) # Warn once per shape and request
+    if report:
+      app.logger.warning('Possible N+1 in %s: statement repeated more than %d times: %s', route, threshold, shape)
+
+  def _handle_error(self, context):
+    # A statement that raised never reaches after_cursor_execute; drop its start time
+    started = context.connection.info.get('query_start_time') if context.connection is not None else None
+    if started and started[-1][0] is context.execution_context:
+      started.pop()
+
+  def _before_render(self, sender, template, context, **extra):
+    stats = g.get('request_stats')
+    if stats is not None:
+      stats.render_started.append(time.perf_counter())
+
+  def _after_render(self, sender, template, context, **extra):
+    stats = g.get('request_stats')
+    if stats is not None and stats.render_started:
+      stats.render_time += time.perf_counter() - stats.render_started.pop()
+      stats.render_count += 1
+
+  def _timed_compile(self, compile):
+    # Wraps Environment.compile, which only runs when a template is loaded from source
+    def timed_compile(*args, **kwargs):
+      started = time.perf_counter()
+      try:
+        return compile(*args, **kwargs)
+      finally:
+        stats = g.get('request_stats') if has_request_context() else None
+        if stats is not None:
+          stats.compile_count += 1
+          stats.compile_time += time.perf_counter() - started
+    return timed_compile
+
+  def _finish_request(self, response):
+    stats = g.get('request_stats')
+    if stats is not None:
+      total = time.perf_counter() - stats.started
+      response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries"' % (stats.query_time * 1000, stats.query_count))
+      response.headers.add('Server-Timing', 'render;dur=%.2f;desc="%d templates"' % (stats.render_time * 1000, stats.render_count))
+      response.headers.add('Server-Timing', 'compile;dur=%.2f;desc="%d templates"' % (stats.compile_time * 1000, stats.compile_count))
+      response.headers.add('Server-Timing', 'total;dur=%.2f' % (total * 1000))
+    return response
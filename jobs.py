@@ -0,0 +1,239 @@
+import json
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, update
+
+from models import db, Job
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Slow work triggered by a request is queued in the `jobs` table instead of
+# running inline: jobs.enqueue() adds a row to the caller's session, so the
+# job exists if and only if the caller's transaction commits. `flask jobs
+# work` processes claim due jobs one at a time (SELECT ... FOR UPDATE SKIP
+# LOCKED on PostgreSQL, plus a compare-and-set UPDATE that also keeps
+# SQLite workers apart), run them in their own transaction and put failed
+# ones back with exponential backoff until JOBS_MAX_ATTEMPTS is reached.
+# A job still `running` after JOBS_TIMEOUT_SECONDS (its worker died) is
+# queued again.
+#
+# With JOBS_INLINE (the default, for deployments without a worker) enqueue()
+# runs the job immediately in the caller's transaction instead.
+#
+# Jobs that invalidate cached pages do so in the worker's page cache, so
+# create_app() refuses JOBS_INLINE=0 with the page cache on unless
+# CACHE_BACKEND is shared with the web processes.
+#
+# Queue depth and job latency are served at /jobs/stats and by `flask jobs
+# stats`; every job run is logged with its queue wait and run time.
+
+JOBS = {} # name -> function, registered with @job
+
+ERROR_LENGTH = 10000 # Characters of traceback kept in last_error
+
+jobs_cli = AppGroup('jobs', help='Run and inspect background jobs.')
+
+
+def job(name):
+  # Registers a function as the job `name`; it is called with the payload's keyword arguments
+  def decorator(function):
+    JOBS[name] = function
+    return function
+  return decorator
+
+
+def enqueue(name, run_at=None, max_attempts=None, **payload):
+  if name not in JOBS:
+    raise ValueError('Unknown job: %s' % name)
+  payload = json.dumps(payload) # Also with JOBS_INLINE, so arguments that can't be queued fail early
+  if current_app.config['JOBS_INLINE']:
+    JOBS[name](**json.loads(payload))
+    return None
+  now = datetime.utcnow()
+  entry = Job(name=name, payload=payload, status='queued', attempts=0, created_at=now, run_at=run_at or now,
+              max_attempts=max_attempts or current_app.config['JOBS_MAX_ATTEMPTS'])
+  db.session.add(entry)
+  return entry
+
+
+def backoff(attempts):
+  # Seconds before retrying after `attempts` failures: doubling, capped, with
+  # jitter so jobs that failed together don't all retry together
+  config = current_app.config
+  delay = min(config['JOBS_BACKOFF_MAX_SECONDS'], config['JOBS_BACKOFF_SECONDS'] * 2 ** (attempts - 1))
+  return delay * random.uniform(0.8, 1.2)
+
+#----------------------------------------------------------------------------#
+# Worker.
+#----------------------------------------------------------------------------#
+
+def claim(worker):
+  # The oldest due job, marked as running by `worker`; None when there is none
+  for _ in range(5): # Another worker may claim the same candidate first
+    now = datetime.utcnow()
+    candidate = db.session.query(Job.id).filter(Job.status == 'queued', Job.run_at <= now) \
+      .order_by(Job.run_at, Job.id).limit(1).with_for_update(skip_locked=True).scalar()
+    if candidate is None:
+      db.session.rollback()
+      return None
+    claimed = db.session.execute(
+      update(Job).where(Job.id == candidate, Job.status == 'queued')
+      .values(status='running', attempts=Job.attempts + 1, started_at=now, locked_by=worker)
+      .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if claimed:
+      return db.session.get(Job, candidate)
+  return None
+
+
+def _finish(job_id, **values):
+  db.session.execute(update(Job).where(Job.id == job_id).values(**values).execution_options(synchronize_session=False))
+  db.session.commit()
+
+
+def run(entry):
+  # Runs a claimed job in its own transaction and records the outcome
+  job_id, name, attempts, max_attempts = entry.id, entry.name, entry.attempts, entry.max_attempts
+  waited = (entry.started_at - entry.run_at).total_seconds()
+  started = time.perf_counter()
+  try:
+    if name not in JOBS:
+      raise LookupError('Unknown job: %s' % name)
+    JOBS[name](**json.loads(entry.payload))
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    error = traceback.format_exc()[-ERROR_LENGTH:]
+    now = datetime.utcnow()
+    if attempts >= max_attempts:
+      _finish(job_id, status='failed', finished_at=now, locked_by=None, last_error=error)
+      current_app.logger.error('Job %s #%d failed for good after %d attempts:\n%s', name, job_id, attempts, error)
+    else:
+      delay = backoff(attempts)
+      _finish(job_id, status='queued', run_at=now + timedelta(seconds=delay), locked_by=None, last_error=error)
+      current_app.logger.warning('Job %s #%d failed (attempt %d of %d), retrying in %.0fs:\n%s',
+                                 name, job_id, attempts, max_attempts, delay, error)
+    return False
+  _finish(job_id, status='done', finished_at=datetime.utcnow(), locked_by=None)
+  current_app.logger.info('Job %s #%d done in %.1f ms after %.1f ms in the queue',
+                          name, job_id, (time.perf_counter() - started) * 1000, waited * 1000)
+  return True
+
+
+def maintain():
+  # Requeues jobs whose worker died mid-run and deletes finished jobs older than JOBS_KEEP_SECONDS
+  config, now = current_app.config, datetime.utcnow()
+  stale = now - timedelta(seconds=config['JOBS_TIMEOUT_SECONDS'])
+  running = (Job.status == 'running', Job.started_at < stale)
+  db.session.execute(update(Job).where(*running, Job.attempts >= Job.max_attempts)
+                     .values(status='failed', finished_at=now, locked_by=None, last_error='Timed out')
+                     .execution_options(synchronize_session=False))
+  db.session.execute(update(Job).where(*running)
+                     .values(status='queued', run_at=now, locked_by=None, last_error='Timed out')
+                     .execution_options(synchronize_session=False))
+  db.session.execute(delete(Job).where(Job.status.in_(['done', 'failed']),
+                                       Job.finished_at < now - timedelta(seconds=config['JOBS_KEEP_SECONDS']))
+                     .execution_options(synchronize_session=False))
+  db.session.commit()
+
+
+def work(worker=None, burst=False, poll=None, max_jobs=None):
+  # Processes jobs until SIGTERM/SIGINT (after the current job), or with
+  # `burst` until the queue is empty; returns the number of jobs run
+  worker = worker or '%s:%d' % (socket.gethostname(), os.getpid())
+  poll = poll if poll is not None else current_app.config['JOBS_POLL_SECONDS']
+  stopping = []
+  handlers = {signum: signal.signal(signum, lambda received, frame: stopping.append(received))
+              for signum in (signal.SIGTERM, signal.SIGINT)}
+  processed, maintained = 0, 0.0
+  try:
+    while not stopping and (max_jobs is None or processed < max_jobs):
+      if time.monotonic() - maintained >= 60:
+        maintain()
+        maintained = time.monotonic()
+      entry = claim(worker)
+      if entry is None:
+        if burst:
+          break
+        time.sleep(poll)
+        continue
+      run(entry)
+      processed += 1
+      db.session.remove() # A fresh session per job; its connection goes back to the pool
+  finally:
+    for signum, handler in handlers.items():
+      signal.signal(signum, handler)
+  return processed
+
+#----------------------------------------------------------------------------#
+# Instrumentation.
+#----------------------------------------------------------------------------#
+
+def _percentile(values, fraction):
+  values = sorted(values)
+  return values[max(0, int(round(fraction * len(values))) - 1)] if values else None
+
+
+def queue_stats(window=1000):
+  # Queue depth by status, the age of the oldest due job, and wait/run time
+  # percentiles (milliseconds) per job name over the last `window` finished jobs
+  now = datetime.utcnow()
+  depth = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+  oldest = db.session.query(func.min(Job.run_at)).filter(Job.status == 'queued', Job.run_at <= now).scalar()
+  recent = db.session.query(Job.name, Job.run_at, Job.started_at, Job.finished_at) \
+    .filter(Job.status == 'done').order_by(Job.run_at.desc()).limit(window).all()
+
+  timings = {}
+  for name, run_at, started_at, finished_at in recent:
+    wait, run_time = timings.setdefault(name, ([], []))
+    wait.append((started_at - run_at).total_seconds() * 1000)
+    run_time.append((finished_at - started_at).total_seconds() * 1000)
+  return {
+    "depth": {status: depth.get(status, 0) for status in ('queued', 'running', 'done', 'failed')},
+    "due": db.session.query(func.count(Job.id)).filter(Job.status == 'queued', Job.run_at <= now).scalar(),
+    "oldest_due_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0,
+    "jobs": {
+      name: {
+        "count": len(wait),
+        "wait_p50_ms": round(_percentile(wait, 0.50), 1),
+        "wait_p95_ms": round(_percentile(wait, 0.95), 1),
+        "run_p50_ms": round(_percentile(run_time, 0.50), 1),
+        "run_p95_ms": round(_percentile(run_time, 0.95), 1),
+      }
+      for name, (wait, run_time) in sorted(timings.items())
+    },
+  }
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@jobs_cli.command('work')
+@click.option('--burst', is_flag=True, help='Exit once no job is due.')
+@click.option('--poll', type=float, default=None, help='Seconds between polls of an empty queue (JOBS_POLL_SECONDS).')
+@click.option('--max-jobs', type=int, default=None, help='Exit after this many jobs.')
+def work_command(burst, poll, max_jobs):
+  """Run queued jobs until stopped."""
+  config = current_app.config
+  if config['JOBS_INLINE']:
+    click.echo('JOBS_INLINE is on, so requests run their jobs themselves; set JOBS_INLINE=0 to queue them.', err=True)
+  processed = work(burst=burst, poll=poll, max_jobs=max_jobs)
+  click.echo('%d jobs run' % processed)
+
+
+@jobs_cli.command('stats')
+def stats_command():
+  """Show queue depth and recent job latency."""
+  click.echo(json.dumps(queue_stats(), indent=2))
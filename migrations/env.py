@@ -74,6 +74,14 @@ def run_migrations_online():
     connectable = current_app.extensions['migrate'].db.get_engine()
 
     with connectable.connect() as connection:
+        # models.enable_sqlite_foreign_keys turns SQLite foreign keys on for
+        # every connection, but batch migrations rebuild tables by dropping
+        # and renaming them, which fails while child rows reference them.
+        # The pragma only takes effect outside a transaction, so it is set
+        # before the migrations start and restored once they have committed.
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
@@ -81,8 +89,12 @@ def run_migrations_online():
             **current_app.extensions['migrate'].configure_args
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if sqlite:
+                connection.exec_driver_sql('PRAGMA foreign_keys=ON')
 
 
 if context.is_offline_mode():
@@ -0,0 +1,52 @@
+"""delete shows and genre links with their owner, and archive venues/artists
+
+Revision ID: 02ae988eca12
+Revises: 819eed587bdd
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '02ae988eca12'
+down_revision = '819eed587bdd'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table) of every foreign key that now cascades
+CASCADES = [
+    ('shows', 'artist_id', 'artist'),
+    ('shows', 'venue_id', 'venues'),
+    ('venue_genres', 'venue_id', 'venues'),
+    ('artist_genres', 'artist_id', 'artist'),
+]
+
+# PostgreSQL's default constraint names; SQLite's unnamed constraints are given
+# the same names when batch mode reflects and recreates the table
+NAMING_CONVENTION = {"fk": "%(table_name)s_%(column_0_name)s_fkey"}
+
+
+def _recreate_foreign_keys(ondelete):
+    for table, column, referred in CASCADES:
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            name = '%s_%s_fkey' % (table, column)
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _recreate_foreign_keys('CASCADE')
+    with op.batch_alter_table('venues') as batch_op:
+        batch_op.add_column(sa.Column('archived_at', sa.DateTime(), nullable=True))
+    with op.batch_alter_table('artist') as batch_op:
+        batch_op.add_column(sa.Column('archived_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('artist') as batch_op:
+        batch_op.drop_column('archived_at')
+    with op.batch_alter_table('venues') as batch_op:
+        batch_op.drop_column('archived_at')
+    _recreate_foreign_keys(None)
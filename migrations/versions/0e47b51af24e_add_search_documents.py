@@ -0,0 +1,50 @@
+"""add search documents and full-text indexes
+
+Revision ID: 0e47b51af24e
+Revises: 1f25fe9c3a92
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0e47b51af24e'
+down_revision = '1f25fe9c3a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('search_document', sa.Text(), nullable=True))
+    op.add_column('artist', sa.Column('search_document', sa.Text(), nullable=True))
+
+    # Backfill: name, city, state and genres, with the '{Jazz,Rock}' braces and commas turned into spaces
+    op.execute("""
+        UPDATE venues SET search_document = (
+            SELECT trim(coalesce(venues.name, '') || ' ' || coalesce(areas.city, '') || ' ' || coalesce(areas.state, '') || ' ' ||
+                        replace(replace(replace(coalesce(venues.genres, ''), '{', ''), '}', ''), ',', ' '))
+            FROM areas WHERE areas.id = venues.area_id
+        )
+    """)
+    op.execute("""
+        UPDATE artist SET search_document =
+            trim(coalesce(name, '') || ' ' || coalesce(city, '') || ' ' || coalesce(state, '') || ' ' ||
+                 replace(replace(replace(coalesce(genres, ''), '{', ''), '}', ''), ',', ' '))
+    """)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE INDEX ix_venues_search_document ON venues USING gin (to_tsvector('simple', coalesce(search_document, '')))")
+        op.execute("CREATE INDEX ix_artist_search_document ON artist USING gin (to_tsvector('simple', coalesce(search_document, '')))")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_artist_search_document', table_name='artist')
+        op.drop_index('ix_venues_search_document', table_name='venues')
+
+    with op.batch_alter_table('artist') as batch_op:
+        batch_op.drop_column('search_document')
+    with op.batch_alter_table('venues') as batch_op:
+        batch_op.drop_column('search_document')
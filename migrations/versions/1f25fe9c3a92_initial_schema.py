@@ -0,0 +1,81 @@
+"""initial schema
+
+Revision ID: 1f25fe9c3a92
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f25fe9c3a92'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('areas',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=True),
+    sa.Column('city', sa.String(length=120), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('artist',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('city', sa.String(length=120), nullable=True),
+    sa.Column('state', sa.String(length=120), nullable=True),
+    sa.Column('phone', sa.String(length=120), nullable=True),
+    sa.Column('genres', sa.String(length=120), nullable=True),
+    sa.Column('image_link', sa.String(), nullable=True),
+    sa.Column('facebook_link', sa.String(length=120), nullable=True),
+    sa.Column('website_link', sa.String(length=120), nullable=True),
+    sa.Column('seeking_venue', sa.Boolean(), nullable=True),
+    sa.Column('seeking_description', sa.String(length=120), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('venues',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('address', sa.String(length=120), nullable=True),
+    sa.Column('phone', sa.String(length=120), nullable=True),
+    sa.Column('genres', sa.String(length=120), nullable=True),
+    sa.Column('image_link', sa.String(), nullable=True),
+    sa.Column('facebook_link', sa.String(length=120), nullable=True),
+    sa.Column('website_link', sa.String(length=120), nullable=True),
+    sa.Column('seeking_talent', sa.Boolean(), nullable=True),
+    sa.Column('seeking_description', sa.String(length=120), nullable=True),
+    sa.Column('area_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['area_id'], ['areas.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('shows',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('artist_name', sa.String(length=50), nullable=True),
+    sa.Column('artist_image_link', sa.String(), nullable=True),
+    sa.Column('venue_name', sa.String(length=50), nullable=True),
+    sa.Column('venue_image_link', sa.String(), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('shows_table',
+    sa.Column('artist_id', sa.Integer(), nullable=True),
+    sa.Column('venue_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], )
+    )
+
+
+def downgrade():
+    op.drop_table('shows_table')
+    op.drop_table('shows')
+    op.drop_table('venues')
+    op.drop_table('artist')
+    op.drop_table('areas')
@@ -0,0 +1,97 @@
+"""add show end times and booking exclusion constraints
+
+Revision ID: 2ac43374f3d5
+Revises: 9ee4de199775
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2ac43374f3d5'
+down_revision = '9ee4de199775'
+branch_labels = None
+depends_on = None
+
+# Existing shows get the default length (SHOW_DEFAULT_DURATION_MINUTES)
+DEFAULT_DURATION_MINUTES = 120
+
+# On PostgreSQL no two shows of a venue or of an artist may overlap
+EXCLUSIONS = [
+    ('shows_venue_id_during_excl', 'venue_id'),
+    ('shows_artist_id_during_excl', 'artist_id'),
+]
+
+# Shows were booked by start time alone, so the default length can run one
+# into the next show of its venue or artist; such a show is cut short where
+# that show starts. Uses the (venue_id, start_time) and (artist_id,
+# start_time) indexes.
+CLIP = """
+    UPDATE shows SET end_time = (
+        SELECT min(later.start_time) FROM shows AS later
+        WHERE later.{column} = shows.{column} AND later.start_time > shows.start_time
+    )
+    WHERE end_time > (
+        SELECT min(later.start_time) FROM shows AS later
+        WHERE later.{column} = shows.{column} AND later.start_time > shows.start_time
+    )
+"""
+
+# What clipping can't fix: two shows of one venue or artist starting at the same time
+SAME_START = """
+    SELECT first.id, second.id FROM shows AS first
+    JOIN shows AS second ON second.{column} = first.{column} AND second.start_time = first.start_time
+        AND second.id > first.id
+    ORDER BY first.id, second.id
+    LIMIT 20
+"""
+
+
+def upgrade():
+    with op.batch_alter_table('shows', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('end_time', sa.DateTime(), nullable=True))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("UPDATE shows SET end_time = start_time + interval '%d minutes'" % DEFAULT_DURATION_MINUTES)
+    else:
+        # datetime() drops the fractional seconds SQLAlchemy writes; they are appended back so the
+        # stored strings keep one format and compare correctly
+        op.execute("UPDATE shows SET end_time = datetime(start_time, '+%d minutes') || substr(start_time, 20)"
+                   % DEFAULT_DURATION_MINUTES)
+
+    for _, column in EXCLUSIONS:
+        op.execute(CLIP.format(column=column))
+
+    with op.batch_alter_table('shows', schema=None) as batch_op:
+        batch_op.create_check_constraint('ck_shows_end_after_start', 'end_time > start_time')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # Rather than fail on the constraint below, name every pair to resolve;
+        # the upgrade runs in one transaction, so nothing is left half done
+        pairs = [(column, first, second) for _, column in EXCLUSIONS
+                 for first, second in op.get_bind().execute(sa.text(SAME_START.format(column=column)))]
+        if pairs:
+            raise RuntimeError(
+                'These shows start at the same time as another show of the same venue or artist; move or '
+                'delete one of each pair, then upgrade again: %s'
+                % ', '.join('shows %d and %d (same %s)' % (first, second, column[:-3]) for column, first, second in pairs)
+            )
+        # btree_gist lets the GiST index compare the integer ids with = next to the ranges' &&
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for name, column in EXCLUSIONS:
+            op.execute(
+                'ALTER TABLE shows ADD CONSTRAINT %s EXCLUDE USING gist (%s WITH =, tsrange(start_time, end_time) WITH &&) '
+                'WHERE (start_time IS NOT NULL AND end_time IS NOT NULL)' % (name, column)
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name, _ in reversed(EXCLUSIONS):
+            op.execute('ALTER TABLE shows DROP CONSTRAINT %s' % name)
+
+    with op.batch_alter_table('shows', schema=None) as batch_op:
+        batch_op.drop_constraint('ck_shows_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
@@ -0,0 +1,94 @@
+"""normalize genres into a genres table with junction tables
+
+Revision ID: 4a0756b427bf
+Revises: 31af229b6dd5
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a0756b427bf'
+down_revision = '31af229b6dd5'
+branch_labels = None
+depends_on = None
+
+
+def _parse(genres):
+    # The old columns hold a stringified list, e.g. '{Jazz,"Rock n Roll"}'
+    return [genre.strip().strip('"') for genre in (genres or '').strip('{}').split(',') if genre.strip().strip('"')]
+
+
+def upgrade():
+    genres = op.create_table('genres',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    venue_genres = op.create_table('venue_genres',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_venue_genres_genre_id', 'venue_genres', ['genre_id', 'venue_id'], unique=False)
+    artist_genres = op.create_table('artist_genres',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_artist_genres_genre_id', 'artist_genres', ['genre_id', 'artist_id'], unique=False)
+
+    # Backfill the junction tables from the stringified columns
+    connection = op.get_bind()
+    venues = connection.execute(sa.text('SELECT id, genres FROM venues')).fetchall()
+    artists = connection.execute(sa.text('SELECT id, genres FROM artist')).fetchall()
+    names = sorted({name for _, value in venues + artists for name in _parse(value)})
+    genre_ids = {name: index for index, name in enumerate(names, start=1)}
+    if genre_ids:
+        op.bulk_insert(genres, [{'id': genre_id, 'name': name} for name, genre_id in genre_ids.items()])
+    venue_rows = [{'venue_id': row_id, 'genre_id': genre_ids[name]} for row_id, value in venues for name in set(_parse(value))]
+    if venue_rows:
+        op.bulk_insert(venue_genres, venue_rows)
+    artist_rows = [{'artist_id': row_id, 'genre_id': genre_ids[name]} for row_id, value in artists for name in set(_parse(value))]
+    if artist_rows:
+        op.bulk_insert(artist_genres, artist_rows)
+    if genre_ids and connection.dialect.name == 'postgresql':
+        op.execute("SELECT setval('genres_id_seq', (SELECT max(id) FROM genres))")
+
+    with op.batch_alter_table('venues') as batch_op:
+        batch_op.drop_column('genres')
+    with op.batch_alter_table('artist') as batch_op:
+        batch_op.drop_column('genres')
+
+
+def downgrade():
+    with op.batch_alter_table('artist') as batch_op:
+        batch_op.add_column(sa.Column('genres', sa.String(length=120), nullable=True))
+    with op.batch_alter_table('venues') as batch_op:
+        batch_op.add_column(sa.Column('genres', sa.String(length=120), nullable=True))
+
+    connection = op.get_bind()
+    for table, junction, key in (('venues', 'venue_genres', 'venue_id'), ('artist', 'artist_genres', 'artist_id')):
+        rows = connection.execute(sa.text(
+            'SELECT {junction}.{key}, genres.name FROM {junction} JOIN genres ON genres.id = {junction}.genre_id '
+            'ORDER BY {junction}.{key}, genres.name'.format(junction=junction, key=key)
+        )).fetchall()
+        collected = {}
+        for row_id, name in rows:
+            collected.setdefault(row_id, []).append(name)
+        for row_id, names in collected.items():
+            connection.execute(sa.text('UPDATE {} SET genres = :genres WHERE id = :id'.format(table)),
+                               {'genres': '{' + ','.join(names) + '}', 'id': row_id})
+
+    op.drop_index('ix_artist_genres_genre_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_index('ix_venue_genres_genre_id', table_name='venue_genres')
+    op.drop_table('venue_genres')
+    op.drop_table('genres')
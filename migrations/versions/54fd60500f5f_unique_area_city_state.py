@@ -0,0 +1,43 @@
+"""make areas unique on (city, state)
+
+Revision ID: 54fd60500f5f
+Revises: 4a0756b427bf
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '54fd60500f5f'
+down_revision = '4a0756b427bf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge duplicate areas into the oldest row before adding the constraint
+    op.execute("""
+        UPDATE venues SET area_id = (
+            SELECT min(keep.id) FROM areas keep, areas dup
+            WHERE dup.id = venues.area_id AND keep.city = dup.city AND keep.state = dup.state
+        )
+        WHERE area_id IN (
+            SELECT dup.id FROM areas dup, areas keep
+            WHERE keep.city = dup.city AND keep.state = dup.state AND keep.id < dup.id
+        )
+    """)
+    op.execute("""
+        DELETE FROM areas WHERE id IN (
+            SELECT dup.id FROM areas dup, areas keep
+            WHERE keep.city = dup.city AND keep.state = dup.state AND keep.id < dup.id
+        )
+    """)
+    with op.batch_alter_table('areas') as batch_op:
+        batch_op.create_unique_constraint('uq_areas_city_state', ['city', 'state'])
+
+
+def downgrade():
+    with op.batch_alter_table('areas') as batch_op:
+        batch_op.drop_constraint('uq_areas_city_state', type_='unique')
@@ -0,0 +1,43 @@
+"""drop artist/venue names and images copied into shows
+
+Revision ID: 57e49778bbdf
+Revises: 5ef5daf6d5e7
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '57e49778bbdf'
+down_revision = '5ef5daf6d5e7'
+branch_labels = None
+depends_on = None
+
+COPIED_COLUMNS = ['artist_name', 'artist_image_link', 'venue_name', 'venue_image_link']
+
+
+def upgrade():
+    # artist_id and venue_id are NOT NULL foreign keys, so every show can
+    # already be joined to its artist and venue; nothing needs backfilling
+    with op.batch_alter_table('shows') as batch_op:
+        for column in COPIED_COLUMNS:
+            batch_op.drop_column(column)
+
+
+def downgrade():
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.add_column(sa.Column('artist_name', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('artist_image_link', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('venue_name', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('venue_image_link', sa.String(), nullable=True))
+
+    # Backfill the copies from the current artist and venue rows
+    op.execute("""
+        UPDATE shows SET
+            artist_name = (SELECT name FROM artist WHERE artist.id = shows.artist_id),
+            artist_image_link = (SELECT image_link FROM artist WHERE artist.id = shows.artist_id),
+            venue_name = (SELECT name FROM venues WHERE venues.id = shows.venue_id),
+            venue_image_link = (SELECT image_link FROM venues WHERE venues.id = shows.venue_id)
+    """)
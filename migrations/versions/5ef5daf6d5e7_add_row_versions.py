@@ -0,0 +1,29 @@
+"""add row version columns
+
+Revision ID: 5ef5daf6d5e7
+Revises: 54fd60500f5f
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5ef5daf6d5e7'
+down_revision = '54fd60500f5f'
+branch_labels = None
+depends_on = None
+
+TABLES = ['areas', 'artist', 'venues', 'shows']
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,31 @@
+"""drop the redundant shows_table association
+
+Revision ID: 819eed587bdd
+Revises: 57e49778bbdf
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '819eed587bdd'
+down_revision = '57e49778bbdf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Artist.performing / Venue.performers are now derived from shows
+    op.drop_table('shows_table')
+
+
+def downgrade():
+    op.create_table('shows_table',
+    sa.Column('artist_id', sa.Integer(), nullable=True),
+    sa.Column('venue_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], )
+    )
+    op.execute('INSERT INTO shows_table (artist_id, venue_id) SELECT DISTINCT artist_id, venue_id FROM shows')
@@ -0,0 +1,35 @@
+"""add venue coordinates and grid cell index
+
+Revision ID: 9867f0440177
+Revises: 2ac43374f3d5
+Create Date: 2026-10-18 21:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9867f0440177'
+down_revision = '2ac43374f3d5'
+branch_labels = None
+depends_on = None
+
+# Existing venues are located afterwards with `flask geocode-venues`, which
+# reads the bundled city centroids and computes geo_cell in Python
+
+
+def upgrade():
+    with op.batch_alter_table('venues', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geo_cell', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_venues_geo_cell', ['geo_cell'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('venues', schema=None) as batch_op:
+        batch_op.drop_index('ix_venues_geo_cell')
+        batch_op.drop_column('geo_cell')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,58 @@
+"""precomputed show statistics per venue and artist
+
+Revision ID: 9ee4de199775
+Revises: 02ae988eca12
+Create Date: 2026-10-18 13:30:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9ee4de199775'
+down_revision = '02ae988eca12'
+branch_labels = None
+depends_on = None
+
+# (stats table, key column, owner table)
+STATS = [
+    ('venue_stats', 'venue_id', 'venues'),
+    ('artist_stats', 'artist_id', 'artist'),
+]
+
+
+def upgrade():
+    for table, key, owner in STATS:
+        op.create_table(table,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('upcoming_shows_count', sa.Integer(), nullable=False),
+        sa.Column('past_shows_count', sa.Integer(), nullable=False),
+        sa.Column('last_show_time', sa.DateTime(), nullable=True),
+        sa.Column('next_show_time', sa.DateTime(), nullable=True),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint([key], ['%s.id' % owner], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(key)
+        )
+        op.create_index('ix_%s_next_show_time' % table, table, ['next_show_time'], unique=False)
+
+        # Backfill; `now` is bound from Python so it matches the naive UTC times the app stores
+        op.execute(sa.text(
+            'INSERT INTO {table} ({key}, upcoming_shows_count, past_shows_count, last_show_time, next_show_time, refreshed_at) '
+            'SELECT {owner}.id, '
+            'COUNT(CASE WHEN shows.start_time >= :now THEN shows.id END), '
+            'COUNT(CASE WHEN shows.start_time < :now THEN shows.id END), '
+            'MAX(CASE WHEN shows.start_time < :now THEN shows.start_time END), '
+            'MIN(CASE WHEN shows.start_time >= :now THEN shows.start_time END), '
+            ':now '
+            'FROM {owner} LEFT OUTER JOIN shows ON shows.{key} = {owner}.id '
+            'GROUP BY {owner}.id'.format(table=table, key=key, owner=owner)
+        ).bindparams(sa.bindparam('now', datetime.utcnow(), type_=sa.DateTime())))
+
+
+def downgrade():
+    for table, key, owner in reversed(STATS):
+        op.drop_index('ix_%s_next_show_time' % table, table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,61 @@
+"""make area city and state required and index the venue listing order
+
+Revision ID: b3d1f4a27c90
+Revises: 6240af13b710
+Create Date: 2026-10-18 23:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d1f4a27c90'
+down_revision = '6240af13b710'
+branch_labels = None
+depends_on = None
+
+# Areas that only differ by NULL versus '' become one area
+SAME_AREA = "coalesce(keep.city, '') = coalesce(dup.city, '') AND coalesce(keep.state, '') = coalesce(dup.state, '')"
+
+
+def upgrade():
+    # Merge the duplicates into the oldest row first; the unique constraint
+    # let them in because NULLs never compare equal
+    op.execute("""
+        UPDATE venues SET area_id = (
+            SELECT min(keep.id) FROM areas keep, areas dup
+            WHERE dup.id = venues.area_id AND %s
+        )
+        WHERE area_id IN (
+            SELECT dup.id FROM areas dup, areas keep
+            WHERE %s AND keep.id < dup.id
+        )
+    """ % (SAME_AREA, SAME_AREA))
+    op.execute("""
+        DELETE FROM areas WHERE id IN (
+            SELECT dup.id FROM areas dup, areas keep
+            WHERE %s AND keep.id < dup.id
+        )
+    """ % SAME_AREA)
+    op.execute("UPDATE areas SET city = '' WHERE city IS NULL")
+    op.execute("UPDATE areas SET state = '' WHERE state IS NULL")
+
+    with op.batch_alter_table('areas', schema=None) as batch_op:
+        batch_op.alter_column('state', existing_type=sa.String(length=120), nullable=False, server_default='')
+        batch_op.alter_column('city', existing_type=sa.String(length=120), nullable=False, server_default='')
+        # /venues pages walk areas in this order and each area's venues by id
+        batch_op.create_index('ix_areas_state_city_id', ['state', 'city', 'id'], unique=False)
+
+    with op.batch_alter_table('venues', schema=None) as batch_op:
+        batch_op.create_index('ix_venues_area_id_id', ['area_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('venues', schema=None) as batch_op:
+        batch_op.drop_index('ix_venues_area_id_id')
+
+    with op.batch_alter_table('areas', schema=None) as batch_op:
+        batch_op.drop_index('ix_areas_state_city_id')
+        batch_op.alter_column('city', existing_type=sa.String(length=120), nullable=True, server_default=None)
+        batch_op.alter_column('state', existing_type=sa.String(length=120), nullable=True, server_default=None)
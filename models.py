@@ -1,50 +1,142 @@
+import sqlite3
+from datetime import datetime
+
 from flask_sqlalchemy import SQLAlchemy
 from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 # app = Flask(__name__)
 db = SQLAlchemy()
 
-shows_table = db.Table('shows_table',
-  db.Column('artist_id', db.Integer, db.ForeignKey('artist.id')),
-  db.Column('venue_id', db.Integer, db.ForeignKey('venues.id'))
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  # SQLite ignores foreign keys, and so ON DELETE CASCADE, unless asked per connection
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+# Genres are normalized into their own table; these junction tables are
+# indexed on genre_id first so browsing by genre never scans venues/artists
+venue_genres = db.Table('venue_genres',
+  db.Column('venue_id', db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+  db.Index('ix_venue_genres_genre_id', 'genre_id', 'venue_id')
 )
 
-# class ShowsTable(Base):
-#   __tablename__ = 'shows_table'
+artist_genres = db.Table('artist_genres',
+  db.Column('artist_id', db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+  db.Index('ix_artist_genres_genre_id', 'genre_id', 'artist_id')
+)
+
+class Show(db.Model):
+  __tablename__ = 'shows'
+  __table_args__ = (
+    # Detail pages fetch a venue's or an artist's shows ordered by start time
+    db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    # Overlapping shows of one venue or artist are rejected by bookings.py (and
+    # on PostgreSQL by exclusion constraints created in the migration)
+    db.CheckConstraint('end_time > start_time', name='ck_shows_end_after_start'),
+  )
+
+  # Artist and venue names and images are joined in when shows are listed, never copied here
+  id = db.Column(db.Integer, primary_key=True)
+  start_time = db.Column(db.DateTime)
+  end_time = db.Column(db.DateTime) # Exclusive: the next show may start at this time
+  # Deleting an artist or venue deletes its shows in the database, in the same statement
+  artist_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), nullable=False)
+  version = db.Column(db.Integer, nullable=False, server_default='1') # Bumped on every UPDATE; used for API ETags
 
-#   artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), primary_key = True)
-#   venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), primary_key = True)
+  __mapper_args__ = {'version_id_col': version}
 
 
+# Distinct (artist, venue) pairs derived from shows; backs the read-only
+# Artist.performing / Venue.performers relationships, so nothing extra is
+# written when a show is created
+performances = db.select(Show.artist_id, Show.venue_id).distinct().subquery('performances')
 
-class Show(db.Model):
-  __tablename__ = 'shows'
+
+
+class Archivable:
+  # Soft delete: an archived row disappears from listings, search and its
+  # own page but keeps its history (shows) untouched
+  archived_at = db.Column(db.DateTime, nullable=True)
+
+  @classmethod
+  def active(cls):
+    return cls.query.filter(cls.archived_at.is_(None))
+
+  def archive(self):
+    self.archived_at = datetime.utcnow()
+
+
+
+class Genre(db.Model):
+  __tablename__ = 'genres'
 
   id = db.Column(db.Integer, primary_key=True)
-  artist_id = db.Column(db.Integer)
-  artist_name = db.Column(db.String(50))
-  artist_image_link = db.Column(db.String)
-  venue_id = db.Column(db.Integer)
-  venue_name = db.Column(db.String(50))
-  venue_image_link = db.Column(db.String)
-  start_time = db.Column(db.DateTime)
-  artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), nullable=False)
-  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
+  name = db.Column(db.String(50), nullable=False, unique=True)
+
+  @classmethod
+  def from_names(cls, names):
+    # Resolve genre names (as posted by the forms) to Genre rows, adding any that don't exist yet
+    names = list(dict.fromkeys(name for name in names if name))
+    genres = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names)).all()} if names else {}
+    for name in names:
+      if name not in genres:
+        genres[name] = cls(name=name)
+        db.session.add(genres[name])
+    return [genres[name] for name in names]
+
 
-  
 
 class Area(db.Model):
   __tablename__ = 'areas'
+  __table_args__ = (
+    db.UniqueConstraint('city', 'state', name='uq_areas_city_state'),
+    # /venues pages walk areas in this order (see venues() in app.py)
+    db.Index('ix_areas_state_city_id', 'state', 'city', 'id'),
+  )
 
   # The area table contains the list of cities and states, with the venues in those cities  
   id = db.Column(db.Integer, primary_key=True)
-  state = db.Column(db.String(120))
-  city = db.Column(db.String(120))
+  state = db.Column(db.String(120), nullable=False, server_default='') # '' when unknown, so the unique constraint and the index cover it
+  city = db.Column(db.String(120), nullable=False, server_default='')
+  version = db.Column(db.Integer, nullable=False, server_default='1') # Bumped on every UPDATE; used for API ETags
   venues = db.relationship('Venue', backref='area', lazy=True)
 
-
-
-class Artist(db.Model):
+  __mapper_args__ = {'version_id_col': version}
+
+  @classmethod
+  def get_or_create(cls, city, state):
+    # Indexed lookup on (city, state); a missing area is inserted with
+    # ON CONFLICT DO NOTHING so concurrent writers can't create duplicates.
+    # Runs inside the caller's transaction, without committing.
+    city, state = city or '', state or ''
+    area = cls.query.filter_by(city=city, state=state).first()
+    if area is not None:
+      return area
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+      from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+      from sqlalchemy.dialects.sqlite import insert
+    else:
+      area = cls(city=city, state=state)
+      db.session.add(area)
+      return area
+    db.session.execute(insert(cls).values(city=city, state=state).on_conflict_do_nothing(index_elements=['city', 'state']))
+    return cls.query.filter_by(city=city, state=state).one()
+
+
+
+class Artist(Archivable, db.Model):
   __tablename__ = 'artist'
 
   id = db.Column(db.Integer, primary_key=True)
@@ -52,29 +144,96 @@ class Artist(db.Model):
   city = db.Column(db.String(120))
   state = db.Column(db.String(120))
   phone = db.Column(db.String(120))
-  genres = db.Column(db.String(120))
   image_link = db.Column(db.String)
   facebook_link = db.Column(db.String(120))
   website_link = db.Column(db.String(120))
   seeking_venue = db.Column(db.Boolean, default=False)
   seeking_description = db.Column(db.String(120))
-  performing = db.relationship('Venue', secondary=shows_table, backref='performers')
-  shows = db.relationship('Show', backref='artist', lazy=True)
+  search_document = db.Column(db.Text) # Name, city, state and genres, kept up to date by search.py
+  version = db.Column(db.Integer, nullable=False, server_default='1') # Bumped on every UPDATE; used for API ETags
+  genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name', lazy='selectin', backref='artists', passive_deletes=True)
+  performing = db.relationship('Venue', secondary=performances, viewonly=True,
+                               primaryjoin=lambda: Artist.id == performances.c.artist_id,
+                               secondaryjoin=lambda: performances.c.venue_id == Venue.id,
+                               backref=db.backref('performers', viewonly=True))
+  shows = db.relationship('Show', backref='artist', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
+  __mapper_args__ = {'version_id_col': version}
 
 
-class Venue(db.Model):
+
+class Venue(Archivable, db.Model):
   __tablename__ = 'venues'
+  __table_args__ = (
+    # An area's venues in /venues order
+    db.Index('ix_venues_area_id_id', 'area_id', 'id'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   name = db.Column(db.String)
   address = db.Column(db.String(120))
   phone = db.Column(db.String(120))
-  genres = db.Column(db.String(120))
   image_link = db.Column(db.String)
   facebook_link = db.Column(db.String(120))
   website_link = db.Column(db.String(120))
   seeking_talent = db.Column(db.Boolean, default=False)
   seeking_description = db.Column(db.String(120))
   area_id = db.Column(db.Integer, db.ForeignKey('areas.id'), nullable=False)
-  shows = db.relationship('Show', backref='venue', lazy=True)
\ No newline at end of file
+  genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name', lazy='selectin', backref='venues', passive_deletes=True)
+  search_document = db.Column(db.Text) # Name, city, state and genres, kept up to date by search.py
+  latitude = db.Column(db.Float)
+  longitude = db.Column(db.Float)
+  geo_cell = db.Column(db.Integer, index=True) # Grid cell of (latitude, longitude), kept up to date by geo.py
+  version = db.Column(db.Integer, nullable=False, server_default='1') # Bumped on every UPDATE; used for API ETags
+  shows = db.relationship('Show', backref='venue', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+  __mapper_args__ = {'version_id_col': version}
+
+
+
+class VenueStats(db.Model):
+  # Show counters per venue, kept up to date by stats.py. A row is exact until
+  # next_show_time passes, when that show moves from upcoming to past.
+  __tablename__ = 'venue_stats'
+
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True)
+  upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+  past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+  last_show_time = db.Column(db.DateTime) # Latest show that has started
+  next_show_time = db.Column(db.DateTime, index=True) # Earliest show that hasn't
+  refreshed_at = db.Column(db.DateTime, nullable=False)
+
+
+
+class ArtistStats(db.Model):
+  __tablename__ = 'artist_stats'
+
+  artist_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True)
+  upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+  past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+  last_show_time = db.Column(db.DateTime)
+  next_show_time = db.Column(db.DateTime, index=True)
+  refreshed_at = db.Column(db.DateTime, nullable=False)
+
+
+class Job(db.Model):
+  # Work queued for `flask jobs work` (see jobs.py). Workers claim the oldest
+  # due job by its (status, run_at) index; a failed attempt is put back with a
+  # later run_at until max_attempts is reached.
+  __tablename__ = 'jobs'
+  __table_args__ = (
+    db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+  )
+
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String(120), nullable=False)
+  payload = db.Column(db.Text, nullable=False) # JSON keyword arguments
+  status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, done or failed
+  attempts = db.Column(db.Integer, nullable=False, default=0)
+  max_attempts = db.Column(db.Integer, nullable=False)
+  run_at = db.Column(db.DateTime, nullable=False) # Not before; pushed back after each failed attempt
+  created_at = db.Column(db.DateTime, nullable=False)
+  started_at = db.Column(db.DateTime) # Of the latest attempt
+  finished_at = db.Column(db.DateTime)
+  locked_by = db.Column(db.String(120)) # host:pid of the worker running it
+  last_error = db.Column(db.Text)
@@ -0,0 +1,82 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import DateTime, and_, or_
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+# Listings are paged by remembering the sort key of the last (or first) row
+# shown instead of using OFFSET, so every page is one indexed range scan and
+# costs the same whether it is the first page or the ten-thousandth.
+#
+# A cursor is an opaque, URL-safe string holding the direction ('next' or
+# 'prev') and the sort key values of the row to continue from.
+
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor', 'prev_cursor'])
+
+
+class InvalidCursor(ValueError):
+  pass
+
+
+def encode_cursor(direction, values):
+  values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+  payload = json.dumps([direction, values], separators=(',', ':')).encode()
+  return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+  try:
+    payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    direction, values = json.loads(payload)
+  except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+    raise InvalidCursor(cursor)
+  if direction not in ('next', 'prev') or not isinstance(values, list) or len(values) != len(columns):
+    raise InvalidCursor(cursor)
+  try:
+    values = [datetime.fromisoformat(value) if isinstance(getattr(column, 'type', None), DateTime) else value
+              for column, value in zip(columns, values)]
+  except (TypeError, ValueError):
+    raise InvalidCursor(cursor)
+  return direction, values
+
+
+def _beyond(columns, values, backwards):
+  # Lexicographic (a, b, c) > (x, y, z), spelled out so it works on every database
+  clauses = []
+  for position, column in enumerate(columns):
+    equal_prefix = [columns[i] == values[i] for i in range(position)]
+    step = column < values[position] if backwards else column > values[position]
+    clauses.append(and_(*equal_prefix, step))
+  # The bound on the first column alone is implied by the others, but it is
+  # what lets the database start an index range scan there
+  start = columns[0] <= values[0] if backwards else columns[0] >= values[0]
+  return and_(start, or_(*clauses))
+
+
+def paginate_keyset(query, columns, key, cursor=None, per_page=20):
+  # `columns` must form a unique sort key for the query, and `key(row)` must
+  # return that key's values for a fetched row. Raises InvalidCursor.
+  direction, values = decode_cursor(cursor, columns) if cursor else ('next', None)
+  backwards = direction == 'prev'
+
+  if values is not None:
+    query = query.filter(_beyond(columns, values, backwards))
+  query = query.order_by(*[column.desc() if backwards else column.asc() for column in columns])
+
+  rows = query.limit(per_page + 1).all() # One extra row tells us whether another page exists
+  has_more = len(rows) > per_page
+  rows = rows[:per_page]
+  if backwards:
+    rows.reverse()
+
+  has_next = has_more if not backwards else values is not None
+  has_prev = has_more if backwards else values is not None
+  next_cursor = encode_cursor('next', key(rows[-1])) if rows and has_next else None
+  prev_cursor = encode_cursor('prev', key(rows[0])) if rows and has_prev else None
+  return KeysetPage(rows, next_cursor, prev_cursor)
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import copy_current_request_context, current_app, g, has_request_context
+
+from instrumentation import RequestStats
+
+#----------------------------------------------------------------------------#
+# Concurrent reads.
+#----------------------------------------------------------------------------#
+
+# A detail page runs several independent queries (the row itself, its shows,
+# its stats). Run one after another on one connection, the page waits for the
+# sum of their round trips; through read_pool.gather() they run at the same
+# time, each in a worker thread with its own app context and so its own
+# session and pooled connection, and the page waits for the slowest.
+#
+# Only for reads: whatever a call loads comes back detached from the
+# request's session (Row tuples and fully loaded objects are fine, lazy
+# relationships are not). Every request may hold up to READ_POOL_WORKERS + 1
+# connections, so size DB_POOL_SIZE/DB_MAX_OVERFLOW to match. With
+# READ_POOL_WORKERS = 0 the calls run in order in the request's own session.
+
+
+class ReadPool:
+
+  def __init__(self, app=None):
+    self.executor = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.resize(app.config['READ_POOL_WORKERS'])
+    app.extensions['read_pool'] = self
+
+  def resize(self, workers):
+    if self.executor is not None:
+      self.executor.shutdown(wait=True)
+    # Threads start on first use, so gunicorn --preload forks before any exist
+    self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='read-pool') if workers else None
+
+  def gather(self, *calls):
+    # The results of calls, in order. The first runs in the calling thread
+    # while the others run on the pool; an exception from any is re-raised.
+    if self.executor is None or len(calls) < 2:
+      return [call() for call in calls]
+    worker_stats = []
+    futures = [self.executor.submit(self._in_context(call, worker_stats)) for call in calls[1:]]
+    try:
+      first = calls[0]()
+    finally:
+      wait(futures) # Never leave a worker using the request after it ends
+      request_stats = g.get('request_stats') if has_request_context() else None
+      if request_stats is not None:
+        for stats in worker_stats:
+          request_stats.merge(stats)
+    return [first] + [future.result() for future in futures]
+
+  def _in_context(self, call, worker_stats):
+    if not has_request_context():
+      app = current_app._get_current_object()
+      def run():
+        with app.app_context():
+          return call()
+      return run
+
+    # A copy of the request context gets a new app context (g, session) in the
+    # worker. Its queries are counted in stats of its own, which gather() adds
+    # to this request's Server-Timing once the worker is done.
+    instrumented = g.get('request_stats') is not None
+    @copy_current_request_context
+    def run():
+      if instrumented:
+        g.request_stats = RequestStats()
+        worker_stats.append(g.request_stats)
+      return call()
+    return run
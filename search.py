@@ -0,0 +1,110 @@
+import re
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, joinedload
+
+from models import db, Artist, Venue
+
+#----------------------------------------------------------------------------#
+# Search documents.
+#----------------------------------------------------------------------------#
+
+# Venues and artists keep a denormalized `search_document` column holding
+# their name, city, state and genres. On PostgreSQL it is matched through a
+# GIN index on to_tsvector('simple', search_document); on any other database
+# (SQLite during development) with a LIKE scan of the column.
+#
+# Either way every search term has to match the start of a word: "hop" finds
+# "The Musical Hop" and "Hoppers", but not "Bishop".
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+SearchResults = namedtuple('SearchResults', ['items', 'total', 'page', 'per_page'])
+
+
+def tokenize(text):
+  return TOKEN_PATTERN.findall((text or '').lower())
+
+
+def genre_names(genres):
+  return [genre.name for genre in genres or []]
+
+
+def venue_document(venue):
+  area = venue.area
+  parts = [venue.name, area.city if area else None, area.state if area else None] + genre_names(venue.genres)
+  return ' '.join(part for part in parts if part)
+
+
+def artist_document(artist):
+  parts = [artist.name, artist.city, artist.state] + genre_names(artist.genres)
+  return ' '.join(part for part in parts if part)
+
+
+DOCUMENT_BUILDERS = {
+  Venue: venue_document,
+  Artist: artist_document,
+}
+
+def _refresh_documents(session, flush_context, instances):
+  # Runs before every flush so genre collection changes, which don't touch
+  # any column of the owning row, still refresh its document
+  for target in list(session.new) + list(session.dirty):
+    build = DOCUMENT_BUILDERS.get(type(target))
+    if build is not None:
+      document = build(target)
+      if target.search_document != document:
+        target.search_document = document
+
+
+event.listen(Session, 'before_flush', _refresh_documents)
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def _result_options(model):
+  # Relationships results are displayed with, loaded with the page of results
+  # instead of once per row (the API's city and state come from venue.area)
+  return [joinedload(Venue.area)] if model is Venue else []
+
+
+def _search_postgresql(model, terms, page, per_page):
+  vector = func.to_tsvector('simple', func.coalesce(model.search_document, ''))
+  query = func.to_tsquery('simple', ' & '.join(term + ':*' for term in terms))
+  matches = model.active().filter(vector.op('@@')(query))
+  total = matches.count()
+  items = matches.options(*_result_options(model)).order_by(func.ts_rank(vector, query).desc(), model.name, model.id) \
+    .offset((page - 1) * per_page).limit(per_page).all()
+  return items, total
+
+
+def _search_like(model, terms, page, per_page):
+  # The same word-prefix matching as the tsquery, scanning every row; words
+  # are separated by spaces in the document. Ranked by name only.
+  document = ' ' + func.coalesce(model.search_document, '')
+  matches = model.active().filter(*[document.ilike('%% %s%%' % term.replace('_', '/_'), escape='/') for term in terms])
+  total = matches.with_entities(func.count(model.id)).scalar()
+  items = matches.options(*_result_options(model)).order_by(model.name, model.id) \
+    .offset((page - 1) * per_page).limit(per_page).all()
+  return items, total
+
+
+def search(model, search_term, page=1, per_page=None):
+  # Ranked, paginated search over name, city, state and genres of `model`
+  per_page = per_page or current_app.config['SEARCH_RESULTS_PER_PAGE']
+  page = max(page, 1)
+  terms = tokenize(search_term)
+
+  if not terms: # An empty search lists everything, alphabetically
+    query = model.active().order_by(model.name, model.id)
+    items = query.options(*_result_options(model)).offset((page - 1) * per_page).limit(per_page).all()
+    total = query.count()
+  elif db.engine.dialect.name == 'postgresql':
+    items, total = _search_postgresql(model, terms, page, per_page)
+  else:
+    items, total = _search_like(model, terms, page, per_page)
+
+  return SearchResults(items, total, page, per_page)
@@ -0,0 +1,181 @@
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, case, delete, event, func, insert, inspect, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from jobs import job
+from models import db, Artist, ArtistStats, Show, Venue, VenueStats
+
+#----------------------------------------------------------------------------#
+# Precomputed show statistics.
+#----------------------------------------------------------------------------#
+
+# Every venue and artist has one stats row holding its upcoming and past show
+# counts and its last and next show times, so pages read them with a single
+# primary key (or join) lookup instead of counting shows.
+#
+# Rows are recomputed, for just the owners involved, in the same transaction
+# as any flush that adds, moves or deletes shows. Because time moves shows from
+# upcoming to past, a row whose next_show_time has passed is "due" and is
+# recomputed the next time it is read. `flask refresh-stats` rebuilds every
+# row and can be scheduled (e.g. nightly from cron) to reconcile anything
+# written behind the ORM's back.
+
+# owner model -> (stats model, stats key, show foreign key)
+STATS = {
+  Venue: (VenueStats, VenueStats.venue_id, Show.venue_id),
+  Artist: (ArtistStats, ArtistStats.artist_id, Show.artist_id),
+}
+
+# owner model -> the other owner of its shows, and that owner's show foreign key
+COUNTERPARTS = {
+  Venue: (Artist, Show.artist_id),
+  Artist: (Venue, Show.venue_id),
+}
+
+COLUMNS = ['upcoming_shows_count', 'past_shows_count', 'last_show_time', 'next_show_time', 'refreshed_at']
+
+
+def _aggregate(model, now):
+  # Same split as partition_shows: a show is upcoming until its start time has
+  # passed. Like the detail pages, shows of archived artists (or at archived
+  # venues) don't count.
+  stats_model, key, foreign_key = STATS[model]
+  other, other_key = COUNTERPARTS[model]
+  listed = other.archived_at.is_(None)
+  upcoming, past = and_(Show.start_time >= now, listed), and_(Show.start_time < now, listed)
+  return select(
+    model.id,
+    func.count(case((upcoming, Show.id))),
+    func.count(case((past, Show.id))),
+    func.max(case((past, Show.start_time))),
+    func.min(case((upcoming, Show.start_time))),
+    literal(now, db.DateTime),
+  ).select_from(model).outerjoin(Show, foreign_key == model.id).outerjoin(other, other.id == other_key).group_by(model.id)
+
+
+def refresh_stats(connection, model, ids=None, now=None):
+  # Recompute the stats rows of `ids` (all rows when None) with one DELETE and one INSERT ... SELECT
+  stats_model, key, _ = STATS[model]
+  now = now or datetime.utcnow()
+  query, removal = _aggregate(model, now), delete(stats_model.__table__)
+  if ids is not None:
+    ids = sorted(set(ids))
+    if not ids:
+      return
+    query, removal = query.where(model.id.in_(ids)), removal.where(key.in_(ids))
+  connection.execute(removal)
+  connection.execute(insert(stats_model.__table__).from_select([key.name] + COLUMNS, query))
+
+
+def _refresh_for_read(model, ids, now):
+  # Reads commit their refresh in a session of their own, so the request's
+  # session keeps its transaction and loaded objects (committing it would
+  # expire them all). Losing a race with another request refreshing the
+  # same rows is harmless, their result is just as fresh.
+  with Session(db.engine) as session:
+    try:
+      refresh_stats(session, model, ids, now)
+      session.commit()
+    except IntegrityError:
+      session.rollback()
+
+
+def get_stats(model, owner_id, now=None):
+  # One primary key read, preceded by a refresh only when the row is missing or due
+  stats_model = STATS[model][0]
+  now = now or datetime.utcnow()
+  stats = db.session.get(stats_model, owner_id)
+  if stats is None or (stats.next_show_time is not None and stats.next_show_time < now):
+    _refresh_for_read(model, [owner_id], now)
+    stats = db.session.get(stats_model, owner_id, populate_existing=True)
+  return stats
+
+
+def refresh_due(model, ids, now=None):
+  # Brings the due or missing rows among `ids` (one listing page) up to date
+  # and returns whether there were any: a primary key lookup per id, so the
+  # cost follows the page size, not the table. Rows go missing when venues or
+  # artists are inserted behind the ORM's back (bulk Core inserts).
+  stats_model, key, _ = STATS[model]
+  now = now or datetime.utcnow()
+  ids = sorted(set(ids))
+  if not ids:
+    return False
+  next_show_times = dict(db.session.query(key, stats_model.next_show_time).filter(key.in_(ids)))
+  due = [row_id for row_id in ids if row_id not in next_show_times
+         or (next_show_times[row_id] is not None and next_show_times[row_id] < now)]
+  if due:
+    _refresh_for_read(model, due, now)
+  return bool(due)
+
+#----------------------------------------------------------------------------#
+# Maintenance on flush.
+#----------------------------------------------------------------------------#
+
+def _history_values(target, attribute):
+  history = inspect(target).attrs[attribute].history
+  return [value for value in history.sum() if value is not None]
+
+
+def _collect_owners(session, flush_context, instances):
+  # Before the flush, while deleted rows and old foreign keys can still be seen
+  owners = session.info.setdefault('stats_owners', {Venue: set(), Artist: set()})
+  for target in list(session.new) + list(session.dirty) + list(session.deleted):
+    if isinstance(target, Show):
+      owners[Venue].update(_history_values(target, 'venue_id'))
+      owners[Artist].update(_history_values(target, 'artist_id'))
+
+  # A deleted venue takes its shows with it (ON DELETE CASCADE), which changes
+  # its artists' counts, and vice versa; so does archiving or restoring one
+  for model, (other, other_key) in COUNTERPARTS.items():
+    foreign_key = STATS[model][2]
+    changed = [target.id for target in session.deleted if isinstance(target, model)] + \
+      [target.id for target in session.dirty if isinstance(target, model) and inspect(target).attrs.archived_at.history.has_changes()]
+    if changed:
+      owners[other].update(session.connection().execute(select(other_key).where(foreign_key.in_(changed))).scalars())
+
+
+def _refresh_owners(session, flush_context):
+  # After the flush new venues and artists have ids; give them their (empty) rows too
+  owners = session.info.pop('stats_owners', None) or {Venue: set(), Artist: set()}
+  for target in session.new:
+    if type(target) in owners:
+      owners[type(target)].add(target.id)
+  for model, ids in owners.items():
+    refresh_stats(session.connection(), model, ids)
+
+
+event.listen(Session, 'before_flush', _collect_owners)
+event.listen(Session, 'after_flush', _refresh_owners)
+
+#----------------------------------------------------------------------------#
+# Reconciliation.
+#----------------------------------------------------------------------------#
+
+@job('refresh-stats')
+def refresh_stats_job(venue_ids=(), artist_ids=()):
+  # Queued by writes that bypass the flush hooks (the bulk importer). Run by
+  # `flask jobs work`, the invalidation below reaches the web processes
+  # through the shared CACHE_BACKEND that create_app() requires then.
+  refresh_stats(db.session, Venue, venue_ids)
+  refresh_stats(db.session, Artist, artist_ids)
+  page_cache = current_app.extensions.get('page_cache')
+  if page_cache is not None:
+    page_cache.invalidate('venues', *['venue:%s' % venue_id for venue_id in venue_ids],
+                          *['artist:%s' % artist_id for artist_id in artist_ids])
+
+
+@click.command('refresh-stats')
+@with_appcontext
+def refresh_stats_command():
+  """Recompute the show statistics of every venue and artist."""
+  now = datetime.utcnow()
+  for model in STATS:
+    refresh_stats(db.session, model, now=now)
+  db.session.commit()
+  click.echo('Refreshed %d venue and %d artist stats rows' % (VenueStats.query.count(), ArtistStats.query.count()))
@@ -0,0 +1,46 @@
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache
+
+#----------------------------------------------------------------------------#
+# Template compilation.
+#----------------------------------------------------------------------------#
+
+# Jinja compiles a template to Python on its first use in each process. With
+# JINJA_BYTECODE_CACHE the compiled code is also written to a directory that
+# every gunicorn worker (and every later deploy of the same templates) reads
+# from, and PRECOMPILE_TEMPLATES loads every template when the app is built
+# so no request pays for it. `flask compile-templates` fills the bytecode
+# cache ahead of time, e.g. during a build.
+
+
+def init_templates(app):
+  if app.config['JINJA_BYTECODE_CACHE']:
+    directory = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory) if directory else FileSystemBytecodeCache()
+  if app.config['PRECOMPILE_TEMPLATES']:
+    precompile_templates(app)
+
+
+def precompile_templates(app):
+  # Loads (and so compiles, or reads from the bytecode cache) every template; returns their names
+  names = app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html'))
+  for name in names:
+    app.jinja_env.get_template(name)
+  return names
+
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates_command():
+  """Compile every template into the Jinja bytecode cache."""
+  app = current_app._get_current_object()
+  if app.jinja_env.bytecode_cache is None:
+    raise click.ClickException('JINJA_BYTECODE_CACHE is off; there is nowhere to write compiled templates.')
+  names = precompile_templates(app)
+  click.echo('%d templates compiled into %s' % (len(names), app.jinja_env.bytecode_cache.directory))
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+from flask_migrate import Migrate, upgrade
+
+import app as fyyur
+from models import db
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+@pytest.fixture
+def make_app(tmp_path):
+  # Builds apps on fresh SQLite databases in tmp_path, with the schema made by
+  # the migrations as in production (up to `revision`); pages are not cached
+  apps = []
+  def make(name='fyyur', revision='head', **config):
+    app = fyyur.create_app(dict({
+      'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / ('%s.db' % name)),
+      'CACHE_ENABLED': False,
+      'TESTING': True,
+    }, **config))
+    Migrate(app, db)
+    with app.app_context():
+      upgrade(directory=MIGRATIONS, revision=revision)
+    apps.append(app)
+    return app
+  yield make
+  for app in apps:
+    with app.app_context():
+      db.session.remove()
+      db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+  app = make_app()
+  with app.app_context():
+    yield app
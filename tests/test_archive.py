@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import stats
+from models import db, Area, Artist, Show, Venue
+
+
+def book():
+  # A venue with an upcoming and a past show by one artist and an upcoming show by another
+  now = datetime.utcnow().replace(microsecond=0)
+  venue = Venue(name='The Hall', area=Area(city='Austin', state='TX'))
+  stays, leaves = Artist(name='Stays'), Artist(name='Leaves')
+  db.session.add_all([venue, stays, leaves])
+  db.session.flush()
+  db.session.add_all([
+    Show(venue_id=venue.id, artist_id=stays.id, start_time=now + timedelta(days=1), end_time=now + timedelta(days=1, hours=2)),
+    Show(venue_id=venue.id, artist_id=stays.id, start_time=now - timedelta(days=1), end_time=now - timedelta(hours=22)),
+    Show(venue_id=venue.id, artist_id=leaves.id, start_time=now + timedelta(days=2), end_time=now + timedelta(days=2, hours=2)),
+  ])
+  db.session.commit()
+  return venue.id, stays.id, leaves.id
+
+
+def counts(model, owner_id):
+  db.session.expire_all()
+  row = stats.get_stats(model, owner_id)
+  return row.upcoming_shows_count, row.past_shows_count
+
+
+def test_archived_artists_shows_leave_the_venue_page_and_counts(app):
+  venue_id, stays_id, leaves_id = book()
+  assert counts(Venue, venue_id) == (2, 1)
+  client = app.test_client()
+  assert client.get('/artists/%d/delete' % leaves_id).status_code == 302 # Archived, as ARCHIVE_ON_DELETE is on
+  assert counts(Venue, venue_id) == (1, 1)
+  html = client.get('/venues/%d' % venue_id).get_data(as_text=True)
+  assert '/artists/%d"' % stays_id in html and '/artists/%d"' % leaves_id not in html
+  assert '1 Upcoming Show' in html
+
+
+def test_archived_venues_shows_leave_the_artist_page_and_counts(app):
+  venue_id, stays_id, _ = book()
+  other = Venue(name='The Club', area=db.session.get(Venue, venue_id).area)
+  db.session.add(other)
+  db.session.flush()
+  start_time = datetime.utcnow() + timedelta(days=3)
+  db.session.add(Show(venue_id=other.id, artist_id=stays_id, start_time=start_time, end_time=start_time + timedelta(hours=2)))
+  db.session.commit()
+  other_id = other.id
+  assert counts(Artist, stays_id) == (2, 1)
+  client = app.test_client()
+  assert client.get('/venues/%d/delete' % venue_id).status_code == 302
+  assert counts(Artist, stays_id) == (1, 0)
+  html = client.get('/artists/%d' % stays_id).get_data(as_text=True)
+  assert '/venues/%d"' % other_id in html and '/venues/%d"' % venue_id not in html
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+from flask_migrate import upgrade
+from sqlalchemy import text
+
+from bookings import Schedule, find_conflicts
+from conftest import MIGRATIONS
+from models import db, Area, Artist, Show, Venue
+
+EIGHT_PM = datetime(2030, 6, 1, 20, 0)
+
+
+def book(app):
+  # An artist and a venue with one show from 20:00 to 22:00
+  artist, venue = Artist(name='The Band'), Venue(name='The Hall', area=Area(city='Austin', state='TX'))
+  db.session.add_all([artist, venue])
+  db.session.flush()
+  db.session.add(Show(artist_id=artist.id, venue_id=venue.id, start_time=EIGHT_PM, end_time=EIGHT_PM + timedelta(hours=2)))
+  db.session.commit()
+  return artist.id, venue.id
+
+
+def post_show(app, artist_id, venue_id, start_time, end_time):
+  return app.test_client().post('/shows/create', data={
+    'artist_id': str(artist_id), 'venue_id': str(venue_id),
+    'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'), 'end_time': end_time.strftime('%Y-%m-%d %H:%M:%S'),
+  })
+
+
+def test_schedule_overlap_excludes_touching_intervals():
+  schedule = Schedule(timedelta(hours=24))
+  booking = (EIGHT_PM, EIGHT_PM + timedelta(hours=2), 'show 1')
+  schedule.add(*booking)
+  assert schedule.overlapping(EIGHT_PM + timedelta(hours=1), EIGHT_PM + timedelta(hours=3)) == [booking]
+  assert schedule.overlapping(EIGHT_PM - timedelta(hours=1), EIGHT_PM + timedelta(hours=3)) == [booking]
+  # End times are exclusive, so back-to-back shows fit
+  assert schedule.overlapping(EIGHT_PM + timedelta(hours=2), EIGHT_PM + timedelta(hours=4)) == []
+  assert schedule.overlapping(EIGHT_PM - timedelta(hours=2), EIGHT_PM) == []
+
+
+def test_find_conflicts_names_the_owner_that_is_booked(app):
+  artist_id, venue_id = book(app)
+  late = EIGHT_PM + timedelta(hours=1)
+  assert set(find_conflicts(artist_id, venue_id, late, late + timedelta(hours=2))) == {'artist_id', 'venue_id'}
+  assert set(find_conflicts(artist_id + 1, venue_id, late, late + timedelta(hours=2))) == {'venue_id'}
+  assert find_conflicts(artist_id, venue_id, EIGHT_PM + timedelta(hours=2), EIGHT_PM + timedelta(hours=3)) == {}
+
+
+def test_overlapping_show_is_rejected_with_409(app):
+  artist_id, venue_id = book(app)
+  response = post_show(app, artist_id, venue_id, EIGHT_PM + timedelta(minutes=30), EIGHT_PM + timedelta(hours=3))
+  assert response.status_code == 409
+  assert db.session.query(Show).count() == 1
+
+
+def test_touching_show_is_listed(app):
+  artist_id, venue_id = book(app)
+  response = post_show(app, artist_id, venue_id, EIGHT_PM + timedelta(hours=2), EIGHT_PM + timedelta(hours=4))
+  assert response.status_code == 302
+  assert db.session.query(Show).count() == 2
+
+
+def test_migration_clips_shows_that_ran_into_the_next(make_app):
+  # Before end times, shows were booked by start time alone: 18:00 and 19:00
+  # at one venue, and the artist of the 19:00 show again at 20:00 elsewhere
+  app = make_app(revision='9ee4de199775')
+  with app.app_context():
+    db.session.execute(text("INSERT INTO artist (id, name) VALUES (1, 'A'), (2, 'B')"))
+    db.session.execute(text("INSERT INTO areas (id, city, state) VALUES (1, 'Austin', 'TX')"))
+    db.session.execute(text("INSERT INTO venues (id, name, area_id) VALUES (1, 'One', 1), (2, 'Two', 1)"))
+    db.session.execute(text(
+      "INSERT INTO shows (id, artist_id, venue_id, start_time) VALUES "
+      "(1, 1, 1, '2030-06-01 18:00:00.000000'), (2, 2, 1, '2030-06-01 19:00:00.000000'), "
+      "(3, 2, 2, '2030-06-01 20:00:00.000000')"
+    ))
+    db.session.commit()
+    upgrade(directory=MIGRATIONS)
+    end_times = dict(db.session.query(Show.id, Show.end_time))
+  assert end_times == {
+    1: datetime(2030, 6, 1, 19, 0), # Cut at the venue's next show
+    2: datetime(2030, 6, 1, 20, 0), # Cut at the artist's next show
+    3: datetime(2030, 6, 1, 22, 0), # The default length
+  }
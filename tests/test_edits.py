@@ -0,0 +1,68 @@
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from models import db, Area, Artist, Venue
+
+
+def add_venue():
+  venue = Venue(name='The Musical Hop', area=Area(city='San Francisco', state='CA'))
+  db.session.add(venue)
+  db.session.commit()
+  return venue.id, venue.version
+
+
+def edit(app, venue_id, version, name):
+  return app.test_client().post('/venues/%d/edit' % venue_id, data={
+    'name': name, 'city': 'San Francisco', 'state': 'CA', 'version': str(version),
+  })
+
+
+def edited_concurrently():
+  # Another request saves the row between this request reading and writing it
+  def other_request(session, flush_context, instances):
+    for target in list(session.dirty) + list(session.deleted):
+      if isinstance(target, (Venue, Artist)):
+        with db.engine.begin() as connection:
+          connection.execute(update(type(target).__table__).where(type(target).id == target.id)
+                             .values(version=type(target).version + 1))
+  event.listen(Session, 'before_flush', other_request, once=True)
+
+
+def names(venue_id):
+  db.session.expire_all()
+  return db.session.get(Venue, venue_id).name
+
+
+def test_edit_with_the_current_version_is_saved(app):
+  venue_id, version = add_venue()
+  assert edit(app, venue_id, version, 'The Hop').status_code == 302
+  assert names(venue_id) == 'The Hop'
+
+
+def test_edit_of_an_outdated_form_is_rejected_with_409(app):
+  venue_id, version = add_venue()
+  assert edit(app, venue_id, version, 'First').status_code == 302
+  response = edit(app, venue_id, version, 'Second') # Loaded before the first edit was saved
+  assert response.status_code == 409
+  assert b'changed by someone else' in response.data
+  assert b'value="First"' in response.data # The form shows the current values
+  assert names(venue_id) == 'First'
+
+
+def test_edit_racing_another_edit_is_rejected_with_409(app):
+  venue_id, version = add_venue()
+  edited_concurrently()
+  response = edit(app, venue_id, version, 'Second')
+  assert response.status_code == 409
+  assert b'changed by someone else' in response.data
+  assert names(venue_id) == 'The Musical Hop'
+
+
+def test_delete_racing_an_edit_is_not_applied(app):
+  venue_id, _ = add_venue()
+  edited_concurrently()
+  client = app.test_client()
+  response = client.get('/venues/%d/delete' % venue_id)
+  assert response.status_code == 302 and response.location.endswith('/venues/%d' % venue_id)
+  assert db.session.get(Venue, venue_id).archived_at is None
+  assert b'changed by someone else' in client.get(response.location).data
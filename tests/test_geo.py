@@ -0,0 +1,47 @@
+import random
+
+from sqlalchemy import insert
+
+import geo
+from models import db, Area, Venue
+
+
+def scatter(points, spread, seed=0):
+  # Core-inserts venues up to `spread` degrees around each point; returns their (id, latitude, longitude)
+  rng = random.Random(seed)
+  area = Area(city='Anywhere', state='')
+  db.session.add(area)
+  db.session.commit()
+  rows = []
+  for latitude, longitude in points:
+    for _ in range(300):
+      venue_latitude = latitude + rng.uniform(-spread, spread)
+      venue_longitude = (longitude + rng.uniform(-spread, spread) + 180) % 360 - 180
+      rows.append({'name': 'Venue', 'area_id': area.id, 'latitude': venue_latitude, 'longitude': venue_longitude,
+                   'geo_cell': geo.cell(venue_latitude, venue_longitude)})
+  db.session.execute(insert(Venue.__table__), rows)
+  db.session.commit()
+  return db.session.query(Venue.id, Venue.latitude, Venue.longitude).all()
+
+
+def exact(venues, latitude, longitude, radius_km, limit):
+  found = [(geo.distance_km(latitude, longitude, venue_latitude, venue_longitude), venue_id)
+           for venue_id, venue_latitude, venue_longitude in venues]
+  return sorted(item for item in found if item[0] <= radius_km)[:limit]
+
+
+def test_within_matches_measuring_every_venue(app):
+  # Including across the antimeridian and far north, where a degree of longitude is short
+  points = [(30.27, -97.74), (-17.7, 179.95), (64.8, -147.7)]
+  venues = scatter(points, 1.0)
+  for latitude, longitude in points:
+    for radius_km in (5, 25, 100):
+      for limit in (1, 10, 50):
+        assert geo.within(latitude, longitude, radius_km, limit) == exact(venues, latitude, longitude, radius_km, limit)
+
+
+def test_nearest_grows_the_radius_until_enough_venues(app):
+  venues = scatter([(30.27, -97.74)], 0.5)
+  # Well away from the venues: the first radii find none
+  assert geo.nearest(30.27, -96.9, 5, 100) == exact(venues, 30.27, -96.9, 100, 5)
+  assert geo.nearest(30.27, -94.0, 5, 100) == []
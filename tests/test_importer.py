@@ -0,0 +1,41 @@
+import io
+from datetime import datetime, timedelta
+
+from importer import import_rows, read_rows
+from models import db, Area, Artist, Venue
+
+VENUES = """name,city,state,address,phone,genres,facebook_link,seeking_talent
+The Hall,Austin,TX,1 Main Street,555-0001,"Jazz,Blues",https://facebook.com/hall,False
+The Club,Austin,TX,2 Main Street,555-0002,Rock n Roll,https://facebook.com/club,TRUE
+The Barn,Marfa,TX,3 Main Street,555-0003,Folk,https://facebook.com/barn,no
+"""
+
+
+def test_csv_booleans_are_read_in_any_case(app):
+  report = import_rows('venues', read_rows(io.StringIO(VENUES), 'csv'))
+  assert report.inserted == 3, report.errors
+  assert dict(db.session.query(Venue.name, Venue.seeking_talent)) == {'The Hall': False, 'The Club': True, 'The Barn': False}
+
+
+def test_venues_reuse_existing_areas(app):
+  db.session.add(Area(city='Austin', state='TX'))
+  db.session.commit()
+  import_rows('venues', read_rows(io.StringIO(VENUES), 'csv'))
+  assert sorted(db.session.query(Area.city, Area.state)) == [('Austin', 'TX'), ('Marfa', 'TX')]
+
+
+def test_shows_of_archived_artists_or_venues_are_rejected(app):
+  venue = Venue(name='The Hall', area=Area(city='Austin', state='TX'))
+  artist, archived = Artist(name='Playing'), Artist(name='Gone')
+  db.session.add_all([venue, artist, archived])
+  db.session.commit()
+  archived.archive()
+  db.session.commit()
+  start_time = (datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+  rows = [
+    {'artist_id': str(artist.id), 'venue_id': str(venue.id), 'start_time': start_time},
+    {'artist_id': str(archived.id), 'venue_id': str(venue.id), 'start_time': start_time},
+  ]
+  report = import_rows('shows', rows)
+  assert report.inserted == 1
+  assert report.errors == [(2, {'artist_id': ['Unknown artist.']})]
@@ -0,0 +1,52 @@
+import re
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db, Area, Venue
+
+
+def test_each_app_reports_with_its_own_thresholds(make_app, monkeypatch):
+  quiet = make_app(name='quiet', SLOW_QUERY_MS=1e9)
+  noisy = make_app(name='noisy', SLOW_QUERY_MS=0)
+  warnings = []
+  for app in (quiet, noisy):
+    monkeypatch.setattr(app.logger, 'warning', lambda message, *args: warnings.append(message))
+  with quiet.app_context():
+    db.session.execute(text('SELECT 1'))
+  assert warnings == []
+  with noisy.app_context():
+    db.session.execute(text('SELECT 1'))
+  assert warnings == ['Slow query (%.1f ms) in %s: %s']
+
+
+def test_queries_are_counted_once_per_request(make_app):
+  # Registered on each app's engine, so a second app doesn't double the count
+  make_app(name='other')
+  app = make_app()
+  response = app.test_client().get('/artists')
+  assert response.status_code == 200
+  assert 'desc="1 queries"' in response.headers['Server-Timing']
+
+
+def test_failed_statement_leaves_no_start_time(app):
+  connection = db.session.connection()
+  with pytest.raises(OperationalError):
+    connection.execute(text('SELECT * FROM no_such_table'))
+  assert connection.info['query_start_time'] == []
+
+
+def test_read_pool_queries_count_towards_the_request(make_app):
+  counts = []
+  for workers in (0, 2):
+    app = make_app(name='pool%d' % workers, READ_POOL_WORKERS=workers)
+    with app.app_context():
+      venue = Venue(name='The Hall', area=Area(city='Austin', state='TX'))
+      db.session.add(venue)
+      db.session.commit()
+      venue_id = venue.id
+    response = app.test_client().get('/venues/%d' % venue_id)
+    assert response.status_code == 200
+    counts.append(re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1))
+  assert counts[0] == counts[1]
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as fyyur
+import jobs
+from cache import LRUCache
+from models import db, Job
+
+CALLS = []
+
+
+@jobs.job('test-record')
+def record_job(value):
+  CALLS.append(value)
+
+
+@jobs.job('test-fail')
+def fail_job():
+  raise ValueError('Broken on purpose')
+
+
+@pytest.fixture
+def queue(make_app):
+  app = make_app(JOBS_INLINE=False, JOBS_BACKOFF_SECONDS=10, JOBS_BACKOFF_MAX_SECONDS=60, JOBS_TIMEOUT_SECONDS=600)
+  del CALLS[:]
+  with app.app_context():
+    yield app
+
+
+def enqueue(name, **values):
+  entry = jobs.enqueue(name, **values)
+  db.session.commit()
+  return entry.id
+
+
+def test_queued_jobs_need_a_shared_page_cache():
+  config = {'JOBS_INLINE': False, 'CACHE_ENABLED': True}
+  with pytest.raises(RuntimeError):
+    fyyur.create_app(config)
+  fyyur.create_app(dict(config, CACHE_BACKEND=LRUCache()))
+  fyyur.create_app(dict(config, CACHE_ENABLED=False))
+
+
+def test_inline_jobs_run_at_once(make_app):
+  app = make_app(JOBS_INLINE=True)
+  with app.app_context():
+    assert jobs.enqueue('test-record', value=1) is None
+    assert db.session.query(Job).count() == 0
+  assert CALLS == [1]
+
+
+def test_claim_takes_the_oldest_due_job(queue):
+  later = enqueue('test-record', value=2, run_at=datetime.utcnow() + timedelta(hours=1))
+  due = enqueue('test-record', value=1)
+  entry = jobs.claim('worker-1')
+  assert (entry.id, entry.status, entry.attempts, entry.locked_by) == (due, 'running', 1, 'worker-1')
+  # The other job isn't due yet, and a claimed job isn't handed out twice
+  assert jobs.claim('worker-2') is None
+  assert db.session.get(Job, later).status == 'queued'
+
+
+def test_run_marks_a_job_done(queue):
+  job_id = enqueue('test-record', value=1)
+  assert jobs.run(jobs.claim('worker')) is True
+  entry = db.session.get(Job, job_id)
+  assert (entry.status, entry.locked_by) == ('done', None)
+  assert entry.finished_at is not None
+  assert CALLS == [1]
+
+
+def test_failed_job_is_retried_with_backoff(queue):
+  job_id = enqueue('test-fail')
+  before = datetime.utcnow()
+  assert jobs.run(jobs.claim('worker')) is False
+  entry = db.session.get(Job, job_id)
+  assert (entry.status, entry.attempts, entry.locked_by) == ('queued', 1, None)
+  assert 'Broken on purpose' in entry.last_error
+  # JOBS_BACKOFF_SECONDS with up to 20% jitter either way
+  assert before + timedelta(seconds=8) <= entry.run_at <= datetime.utcnow() + timedelta(seconds=12)
+  assert jobs.claim('worker') is None
+
+
+def test_backoff_doubles_up_to_the_maximum(queue):
+  assert 16 <= jobs.backoff(2) <= 24
+  assert 48 <= jobs.backoff(10) <= 72
+
+
+def test_failed_job_gives_up_after_max_attempts(queue):
+  job_id = enqueue('test-fail', max_attempts=2)
+  for attempt in range(2):
+    db.session.get(Job, job_id).run_at = datetime.utcnow() # Skip the backoff
+    db.session.commit()
+    assert jobs.run(jobs.claim('worker')) is False
+  entry = db.session.get(Job, job_id)
+  assert (entry.status, entry.attempts) == ('failed', 2)
+  assert entry.finished_at is not None
+  assert jobs.claim('worker') is None
+
+
+def test_maintain_requeues_timed_out_jobs_and_deletes_old_ones(queue):
+  now = datetime.utcnow()
+  def add(status, attempts, max_attempts=3, started_at=None, finished_at=None):
+    entry = Job(name='test-record', payload='{"value": 1}', status=status, attempts=attempts, max_attempts=max_attempts,
+                run_at=now, created_at=now, started_at=started_at, finished_at=finished_at, locked_by='dead-worker')
+    db.session.add(entry)
+    db.session.flush()
+    return entry.id
+  stale = now - timedelta(seconds=601)
+  retried = add('running', 1, started_at=stale)
+  exhausted = add('running', 3, started_at=stale)
+  busy = add('running', 1, started_at=now)
+  old = add('done', 1, finished_at=now - timedelta(days=2))
+  recent = add('done', 1, finished_at=now)
+  db.session.commit()
+
+  jobs.maintain()
+  status = dict(db.session.query(Job.id, Job.status))
+  assert status == {retried: 'queued', exhausted: 'failed', busy: 'running', recent: 'done'}
+  assert old not in status
+  assert db.session.get(Job, retried).last_error == 'Timed out'
+  assert jobs.claim('worker').id == retried
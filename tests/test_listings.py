@@ -0,0 +1,100 @@
+import re
+
+from flask_migrate import upgrade
+from sqlalchemy import event, insert, text
+
+from benchmark import peak_memory, seed_database, stream_listing
+from conftest import MIGRATIONS
+from models import db, Area, Show, Venue
+
+
+def count_statements(app, path):
+  # SQL statements run while serving `path`
+  statements = []
+  def record(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+  with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+      response = app.test_client().get(path)
+    finally:
+      event.remove(db.engine, 'before_cursor_execute', record)
+  assert response.status_code == 200
+  return len(statements)
+
+
+def seeded(make_app, venues):
+  app = make_app('venues-%d' % venues)
+  with app.app_context():
+    seed_database(areas=venues // 10, venues=venues, artists=venues, shows=venues * 2)
+  return app
+
+
+def test_venues_statements_do_not_grow_with_venues(make_app):
+  small, large = seeded(make_app, 100), seeded(make_app, 1000)
+  assert count_statements(large, '/venues') == count_statements(small, '/venues')
+  # Nor with the rows on a page, so no query runs per area or per venue
+  assert count_statements(large, '/venues?per_page=200') == count_statements(large, '/venues?per_page=10')
+
+
+def test_streamed_shows_listing_keeps_memory_bounded(app):
+  # 20k shows make a page of about 7 MB. Streamed, the peak stays around
+  # 1 MB however many shows there are; holding the rows takes over 10 MB.
+  seed_database(areas=20, venues=200, artists=200, shows=20000)
+  stream_listing(app, '/shows?all=1') # Compiles the template and queries outside the measurement
+  (size, chunks), peak = peak_memory(lambda: stream_listing(app, '/shows?all=1'))
+  assert size > 5 * 2 ** 20 and chunks > 1
+  assert peak < 4 * 2 ** 20
+
+
+def walk(client, path, link):
+  # Venue ids of every page reached by following the `link` ('Next' or
+  # 'Previous') links from `path`, and the path of the last page
+  pages = []
+  while True:
+    html = client.get(path).get_data(as_text=True)
+    pages.append([int(venue_id) for venue_id in re.findall(r'href="/venues/(\d+)"', html)])
+    found = re.search(r'href="(\?cursor=[^"]+)">%s<' % link, html)
+    if found is None:
+      return pages, path
+    path = '/venues' + found.group(1).replace('&amp;', '&')
+
+
+def test_venue_pages_follow_the_area_order_both_ways(app):
+  seed_database(areas=12, venues=90, artists=10, shows=0)
+  expected = [venue_id for (venue_id,) in db.session.query(Venue.id).join(Area)
+              .order_by(Area.state, Area.city, Area.id, Venue.id)]
+  client = app.test_client()
+  pages, last = walk(client, '/venues?per_page=7', 'Next')
+  assert len(pages) == 13
+  assert [venue_id for page in pages for venue_id in page] == expected
+  back, _ = walk(client, last, 'Previous')
+  assert back == pages[::-1]
+
+
+def test_migration_merges_areas_that_differ_by_null(make_app):
+  app = make_app(revision='6240af13b710')
+  with app.app_context():
+    db.session.execute(text("INSERT INTO areas (id, city, state) VALUES (1, 'Austin', NULL), (2, 'Austin', NULL), "
+                            "(3, 'Austin', ''), (4, 'Austin', 'TX')"))
+    db.session.execute(text("INSERT INTO venues (id, name, area_id) VALUES (1, 'A', 1), (2, 'B', 2), (3, 'C', 3), (4, 'D', 4)"))
+    db.session.commit()
+    upgrade(directory=MIGRATIONS)
+    assert db.session.query(Area.id, Area.city, Area.state).order_by(Area.id).all() == [(1, 'Austin', ''), (4, 'Austin', 'TX')]
+    assert dict(db.session.query(Venue.id, Venue.area_id)) == {1: 1, 2: 1, 3: 1, 4: 4}
+
+
+def test_shows_without_a_start_time_are_left_out_of_the_pages(app):
+  seed_database(areas=2, venues=3, artists=3, shows=10)
+  venue_id, artist_id = db.session.query(Show.venue_id, Show.artist_id).first()
+  db.session.execute(insert(Show.__table__), [{'venue_id': venue_id, 'artist_id': artist_id, 'start_time': None}])
+  db.session.commit()
+  client, path, listed = app.test_client(), '/shows?per_page=3', 0
+  while path:
+    response = client.get(path)
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    listed += html.count('tile-show')
+    found = re.search(r'href="(\?cursor=[^"]+)">Next<', html)
+    path = '/shows' + found.group(1).replace('&amp;', '&') if found else None
+  assert listed == 10
@@ -0,0 +1,32 @@
+from sqlalchemy import insert
+
+import search
+from models import db, Area, Venue
+
+
+def names(term):
+  return [venue.name for venue in search.search(Venue, term).items]
+
+
+def test_terms_match_the_start_of_words(app):
+  db.session.add_all([
+    Venue(name='The Musical Hop', area=Area(city='San Francisco', state='CA')),
+    Venue(name='Bishop Hall', area=Area(city='Austin', state='TX')),
+  ])
+  db.session.commit()
+  assert names('hop') == ['The Musical Hop']
+  assert names('MUS hop') == ['The Musical Hop']
+  assert names('san hop') == ['The Musical Hop']
+  assert names('austin hop') == []
+  assert names('bish') == ['Bishop Hall']
+
+
+def test_rows_written_without_the_orm_are_found(app):
+  # Searches read the database, so rows another process or a Core insert wrote are found at once
+  area = Area(city='Austin', state='TX')
+  db.session.add(Venue(name='The Musical Hop', area=area))
+  db.session.commit()
+  assert names('hop') == ['The Musical Hop']
+  db.session.execute(insert(Venue.__table__), [{'name': 'Hop Garden', 'area_id': area.id, 'search_document': 'Hop Garden Austin TX'}])
+  db.session.commit()
+  assert names('hop') == ['Hop Garden', 'The Musical Hop']
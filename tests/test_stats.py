@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, insert
+
+import stats
+from models import db, Area, Artist, Show, Venue, VenueStats
+
+
+def test_refreshing_on_read_leaves_the_request_session_alone(app):
+  venue = Venue(name='The Hall', area=Area(city='Austin', state='TX'))
+  artist = Artist(name='The Band')
+  db.session.add_all([venue, artist])
+  db.session.flush()
+  start_time = datetime.utcnow() + timedelta(days=1)
+  db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time, end_time=start_time + timedelta(hours=2)))
+  db.session.commit()
+  assert stats.get_stats(Venue, venue.id).upcoming_shows_count == 1
+
+  # Once the show has started the row is due
+  later = start_time + timedelta(hours=1)
+  venue.name # Loaded before the refresh, as the detail page loads the venue
+  refreshed = stats.get_stats(Venue, venue.id, now=later)
+  assert (refreshed.upcoming_shows_count, refreshed.past_shows_count) == (0, 1)
+  assert not inspect(venue).expired_attributes
+
+
+def test_listing_pages_create_missing_stats_rows(app):
+  area = Area(city='Austin', state='TX')
+  db.session.add(area)
+  db.session.commit()
+  db.session.execute(insert(Venue.__table__), [{'name': 'Bulk %d' % number, 'area_id': area.id} for number in range(3)])
+  db.session.commit()
+  ids = [venue_id for (venue_id,) in db.session.query(Venue.id)]
+  assert db.session.query(VenueStats).count() == 0
+  assert stats.refresh_due(Venue, ids)
+  assert db.session.query(VenueStats).count() == 3
+  assert not stats.refresh_due(Venue, ids) # Nothing left to do